@@ -1,4 +1,6 @@
+from django import forms
 from django.contrib import admin
+from django.forms.models import BaseInlineFormSet
 from django.shortcuts import reverse
 from django.templatetags.static import static
 from django.utils.html import format_html
@@ -11,13 +13,35 @@ from .models import Restaurant
 from .models import RestaurantMenuItem
 from .models import Order
 from .models import OrderItem
-from geodata.utils import get_or_create_location
+from geodata.utils import enqueue_geocoding
+
+
+class CachedChoicesInlineFormSet(BaseInlineFormSet):
+    # Варианты выпадающих списков загружаются одним запросом на весь набор
+    # форм, а не отдельным запросом для каждой строки.
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cached_choices = {}
+
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        for name, field in form.fields.items():
+            if not isinstance(field, forms.ModelChoiceField) or field.widget.is_hidden:
+                continue
+            if name not in self.cached_choices:
+                self.cached_choices[name] = list(field.choices)
+            field.widget.choices = self.cached_choices[name]
 
 
 class RestaurantMenuItemInline(admin.TabularInline):
     model = RestaurantMenuItem
+    formset = CachedChoicesInlineFormSet
     extra = 0
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('restaurant', 'product')
+
 
 @admin.register(Restaurant)
 class RestaurantAdmin(admin.ModelAdmin):
@@ -30,6 +54,9 @@ class RestaurantAdmin(admin.ModelAdmin):
         'name',
         'address',
         'contact_phone',
+        'latitude',
+        'longitude',
+        'capacity',
     ]
     inlines = [
         RestaurantMenuItemInline
@@ -47,6 +74,9 @@ class ProductAdmin(admin.ModelAdmin):
     list_display_links = [
         'name',
     ]
+    list_select_related = [
+        'category',
+    ]
     list_filter = [
         'category',
     ]
@@ -120,14 +150,26 @@ class OrderItemInline(admin.TabularInline):
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ['firstname', 'lastname', 'phonenumber', 'address', 'status']
+    list_display = ['firstname', 'lastname', 'phonenumber', 'address', 'status', 'total_cost']
     list_filter = ['id', 'status']
-    search_fields = ['firstname', 'lastname', 'phonenumber', 'address']
+    search_fields = ['firstname', 'lastname', 'address', '=intake_id']
+    readonly_fields = ['total_cost', 'intake_id']
     inlines = [OrderItemInline]
 
+    def get_search_results(self, request, queryset, search_term):
+        # Телефон ищется точным совпадением по индексу в E.164, поэтому номер
+        # можно ввести в любом написании.
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        by_phonenumber = queryset.by_phonenumber(search_term.strip())
+        return results | by_phonenumber, may_have_duplicates
+
     def save_model(self, request, obj, form, change):
         super().save_model(request, obj, form, change)
-        get_or_create_location(obj.address)
+        enqueue_geocoding(obj.address)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        Order.objects.filter(pk=form.instance.pk).recalculate_total_cost()
 
     def response_post_save_change(self, request, obj):
         response = super().response_post_save_change(request, obj)
@@ -146,4 +188,17 @@ class OrderAdmin(admin.ModelAdmin):
 class OrderItemAdmin(admin.ModelAdmin):
     list_display = ['order', 'product', 'quantity', 'price']
     list_filter = ['order']
-    search_fields = ['product__name', 'order__firstname', 'order__lastname']
\ No newline at end of file
+    search_fields = ['product__name', 'order__firstname', 'order__lastname']
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        Order.objects.filter(pk__in={obj.order_id, form.initial.get('order')}).recalculate_total_cost()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        Order.objects.filter(pk=obj.order_id).recalculate_total_cost()
+
+    def delete_queryset(self, request, queryset):
+        order_ids = set(queryset.values_list('order_id', flat=True))
+        super().delete_queryset(request, queryset)
+        Order.objects.filter(pk__in=order_ids).recalculate_total_cost()
\ No newline at end of file
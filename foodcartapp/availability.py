@@ -0,0 +1,111 @@
+import threading
+
+from django.core.cache import cache
+
+
+AVAILABILITY_VERSION_KEY = 'foodcartapp:availability-version'
+
+
+class AvailabilityIndex:
+    # Для каждого товара хранится битовая маска ресторанов, где он в продаже.
+    # Версия индекса лежит в общем кэше: процесс, изменивший меню, обновляет
+    # свою копию точечно, остальные перестраивают индекс при смене версии.
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._version = None
+        self._restaurant_bits = {}
+        self._restaurant_ids = []
+        self._product_masks = {}
+
+    def available_product_ids(self):
+        with self._lock:
+            self._ensure_fresh()
+            return [
+                product_id
+                for product_id, mask in self._product_masks.items()
+                if mask
+            ]
+
+    def restaurants_for(self, product_ids):
+        with self._lock:
+            self._ensure_fresh()
+            if not product_ids:
+                return []
+            common_mask = -1
+            for product_id in product_ids:
+                common_mask &= self._product_masks.get(product_id, 0)
+                if not common_mask:
+                    return []
+            return self._decode(common_mask)
+
+    def set_availability(self, restaurant_id, product_id, available):
+        with self._lock:
+            old_version = self._version
+            is_current = old_version is not None and old_version == self._get_version()
+            if is_current:
+                bit = self._get_restaurant_bit(restaurant_id)
+                mask = self._product_masks.get(product_id, 0)
+                if available:
+                    self._product_masks[product_id] = mask | bit
+                else:
+                    self._product_masks[product_id] = mask & ~bit
+            new_version = self._bump_version()
+            # Если между проверкой и incr версию сменил другой процесс, его
+            # изменения в локальной копии нет, и её надо перестроить.
+            if is_current and new_version == old_version + 1:
+                self._version = new_version
+            else:
+                self._version = None
+
+    def invalidate(self):
+        with self._lock:
+            self._bump_version()
+
+    def _ensure_fresh(self):
+        version = self._get_version()
+        if version != self._version:
+            self._rebuild()
+            self._version = version
+
+    def _rebuild(self):
+        from .models import RestaurantMenuItem
+
+        self._restaurant_bits = {}
+        self._restaurant_ids = []
+        self._product_masks = {}
+        menu_items = (
+            RestaurantMenuItem.objects
+            .filter(availability=True)
+            .values_list('restaurant_id', 'product_id')
+        )
+        for restaurant_id, product_id in menu_items:
+            bit = self._get_restaurant_bit(restaurant_id)
+            self._product_masks[product_id] = self._product_masks.get(product_id, 0) | bit
+
+    def _get_restaurant_bit(self, restaurant_id):
+        if restaurant_id not in self._restaurant_bits:
+            self._restaurant_bits[restaurant_id] = 1 << len(self._restaurant_ids)
+            self._restaurant_ids.append(restaurant_id)
+        return self._restaurant_bits[restaurant_id]
+
+    def _decode(self, mask):
+        restaurant_ids = []
+        position = 0
+        while mask:
+            if mask & 1:
+                restaurant_ids.append(self._restaurant_ids[position])
+            mask >>= 1
+            position += 1
+        return restaurant_ids
+
+    def _get_version(self):
+        cache.add(AVAILABILITY_VERSION_KEY, 0, timeout=None)
+        return cache.get(AVAILABILITY_VERSION_KEY)
+
+    def _bump_version(self):
+        cache.add(AVAILABILITY_VERSION_KEY, 0, timeout=None)
+        return cache.incr(AVAILABILITY_VERSION_KEY)
+
+
+availability_index = AvailabilityIndex()
@@ -0,0 +1,147 @@
+import threading
+from collections import defaultdict
+
+from django.db import transaction
+
+from geodata.distance_cache import get_distances
+from geodata.models import Location
+
+from .availability import availability_index
+from .models import Order, OrderCandidate, OrderItem, Restaurant, RestaurantMenuItem
+from .order_feed import is_pending_on_commit
+from .restaurant_index import find_nearest_restaurants, get_restaurant_index
+
+
+REFRESH_BATCH_SIZE = 500
+
+_pending = threading.local()
+
+
+def build_order_candidates(orders):
+    product_ids_by_order = defaultdict(list)
+    items = OrderItem.objects.filter(order__in=orders).values_list('order_id', 'product_id')
+    for order_id, product_id in items:
+        product_ids_by_order[order_id].append(product_id)
+
+    location_by_address = {
+        location.normalized_address: location
+        for location in Location.objects.filter(
+            normalized_address__in={order.normalized_address for order in orders},
+            latitude__isnull=False,
+            longitude__isnull=False,
+        )
+    }
+    restaurant_locations = dict(Restaurant.objects.values_list('id', 'location_id'))
+    restaurant_index = get_restaurant_index()
+
+    candidates = []
+    nearest_by_order = {}
+    for order in orders:
+        restaurant_ids = [
+            restaurant_id
+            for restaurant_id in availability_index.restaurants_for(product_ids_by_order[order.id])
+            if restaurant_id in restaurant_locations
+        ]
+        location = location_by_address.get(order.normalized_address)
+        if location is None:
+            candidates.extend(
+                OrderCandidate(order=order, restaurant_id=restaurant_id)
+                for restaurant_id in restaurant_ids
+            )
+            continue
+
+        order_coord = (float(location.latitude), float(location.longitude))
+        nearest_by_order[order] = (
+            location,
+            find_nearest_restaurants(order_coord, restaurant_ids, index=restaurant_index),
+        )
+        candidates.extend(
+            OrderCandidate(order=order, restaurant_id=restaurant_id)
+            for restaurant_id in restaurant_ids
+            if restaurant_id not in restaurant_index
+        )
+
+    cached_distances = get_distances(
+        (location.id, restaurant_locations[restaurant_id])
+        for location, nearest in nearest_by_order.values()
+        for restaurant_id, _ in nearest
+        if restaurant_locations[restaurant_id]
+    )
+    for order, (location, nearest) in nearest_by_order.items():
+        for restaurant_id, dist in nearest:
+            dist = cached_distances.get((location.id, restaurant_locations[restaurant_id]), dist)
+            candidates.append(
+                OrderCandidate(order=order, restaurant_id=restaurant_id, distance=round(dist, 2))
+            )
+    return candidates
+
+
+def refresh_order_candidates(order_ids):
+    order_ids = list(order_ids)
+    for start in range(0, len(order_ids), REFRESH_BATCH_SIZE):
+        batch_ids = order_ids[start:start + REFRESH_BATCH_SIZE]
+        orders = list(
+            Order.objects
+            .filter(pk__in=batch_ids)
+            .exclude(status='completed')
+            .only('id', 'normalized_address')
+        )
+        candidates = build_order_candidates(orders)
+        with transaction.atomic():
+            OrderCandidate.objects.filter(order_id__in=batch_ids).delete()
+            OrderCandidate.objects.bulk_create(candidates)
+
+
+def get_open_order_ids():
+    return Order.objects.exclude(status='completed').values_list('id', flat=True)
+
+
+def get_restaurant_order_ids(restaurant_ids):
+    # Открытые заказы, у которых переезд или удаление ресторанов может
+    # поменять кандидатов: где рестораны уже в кандидатах, и те, все товары
+    # которых есть в их меню.
+    order_ids = set(
+        OrderCandidate.objects
+        .filter(restaurant_id__in=restaurant_ids)
+        .values_list('order_id', flat=True)
+    )
+    for restaurant_id in restaurant_ids:
+        menu_product_ids = (
+            RestaurantMenuItem.objects
+            .filter(restaurant_id=restaurant_id, availability=True)
+            .values('product_id')
+        )
+        order_ids.update(
+            get_open_order_ids()
+            .filter(items__product_id__in=menu_product_ids)
+            .exclude(items__in=OrderItem.objects.exclude(product_id__in=menu_product_ids))
+            .distinct()
+        )
+    return order_ids
+
+
+def schedule_candidates_refresh(order_ids):
+    # Пересчёт откладывается до коммита и объединяется: заказ из десяти
+    # позиций пересчитывается один раз, а не десять. Заказы копятся в пачке,
+    # привязанной к своему обработчику on_commit, как события в order_feed:
+    # откаченная транзакция уносит пачку с собой.
+    batch = getattr(_pending, 'batch', None)
+    is_new_batch = batch is None or not is_pending_on_commit(batch)
+    if is_new_batch:
+        batch = _pending.batch = CandidatesRefreshBatch()
+    batch.order_ids.update(order_ids)
+    if is_new_batch:
+        transaction.on_commit(batch.flush)
+
+
+class CandidatesRefreshBatch:
+    def __init__(self):
+        self.order_ids = set()
+        self.flushed = False
+
+    def flush(self):
+        self.flushed = True
+        if not self.order_ids:
+            return
+        order_ids, self.order_ids = self.order_ids, set()
+        refresh_order_candidates(order_ids)
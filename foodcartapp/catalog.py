@@ -0,0 +1,89 @@
+import hashlib
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from .models import Product
+
+
+CATALOG_CACHE_KEY = 'foodcartapp:catalog'
+CATALOG_VERSION_KEY = 'foodcartapp:catalog-version'
+CATALOG_CACHE_TIMEOUT = 24 * 60 * 60
+
+CatalogSnapshot = namedtuple('CatalogSnapshot', ['version', 'body'])
+
+
+def serialize_product(product):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'price': product.price,
+        'special_status': product.special_status,
+        'description': product.description,
+        'category': {
+            'id': product.category.id,
+            'name': product.category.name,
+        } if product.category else None,
+        'image': product.image.url,
+        'restaurant': {
+            'id': product.id,
+            'name': product.name,
+        }
+    }
+
+
+def get_json_dumps_params():
+    if settings.COMPACT_JSON:
+        return {'ensure_ascii': False, 'separators': (',', ':')}
+    return {'ensure_ascii': False, 'indent': 4}
+
+
+def get_catalog_products():
+    return Product.objects.select_related('category').available().order_by('pk')
+
+
+def iter_catalog_chunks(products, chunk_size=None):
+    chunk_size = chunk_size or settings.CATALOG_CHUNK_SIZE
+    encoder = DjangoJSONEncoder(**get_json_dumps_params())
+
+    chunk = [b'[']
+    is_first = True
+    for product in products.iterator(chunk_size=chunk_size):
+        encoded = encoder.encode(serialize_product(product)).encode('utf-8')
+        chunk.append(encoded if is_first else b',' + encoded)
+        is_first = False
+        if len(chunk) >= chunk_size:
+            yield b''.join(chunk)
+            chunk = []
+    chunk.append(b']')
+    yield b''.join(chunk)
+
+
+def build_catalog_snapshot():
+    body = b''.join(iter_catalog_chunks(get_catalog_products()))
+    version = hashlib.sha1(body).hexdigest()
+    return CatalogSnapshot(version=version, body=body)
+
+
+def get_catalog_snapshot():
+    # Версия читается до сборки. Снимок, собранный по данным до коммита,
+    # ляжет под старую версию, которую после коммита уже никто не читает.
+    cache.add(CATALOG_VERSION_KEY, 0, timeout=None)
+    cache_key = f'{CATALOG_CACHE_KEY}:{cache.get(CATALOG_VERSION_KEY)}'
+    snapshot = cache.get(cache_key)
+    if snapshot is None:
+        snapshot = build_catalog_snapshot()
+        cache.set(cache_key, snapshot, timeout=CATALOG_CACHE_TIMEOUT)
+    return snapshot
+
+
+def bump_catalog_version():
+    cache.add(CATALOG_VERSION_KEY, 0, timeout=None)
+    cache.incr(CATALOG_VERSION_KEY)
+
+
+def invalidate_catalog_snapshot(**kwargs):
+    transaction.on_commit(bump_catalog_version)
@@ -0,0 +1,135 @@
+from collections import defaultdict, namedtuple
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, Q
+
+from geodata.distances import haversine_matrix
+from geodata.models import Location
+
+from .availability import availability_index
+from .models import Order, OrderItem, Restaurant
+from .order_feed import schedule_order_event
+
+
+DispatchPlan = namedtuple('DispatchPlan', ['assignments', 'unassigned'])
+
+
+def greedy_assignment(distances, capacities):
+    # Жадное распределение заказов по ресторанам раундами. В каждом раунде
+    # все ещё не распределённые заказы разом выбирают ближайший ресторан со
+    # свободными местами, а ресторан берёт самые близкие из них, сколько
+    # вмещает. Переполненные рестораны из дальнейших раундов выпадают, так что
+    # раундов не больше, чем ресторанов. distances — матрица заказы ×
+    # рестораны с np.inf там, где ресторан не может приготовить заказ.
+    distances = np.array(distances, dtype=float)
+    free = np.array(capacities, dtype=float)
+    assignment = np.full(distances.shape[0], -1)
+    distances[:, free <= 0] = np.inf
+
+    pending = np.arange(distances.shape[0])
+    while pending.size:
+        choices = distances[pending].argmin(axis=1)
+        reachable = np.isfinite(distances[pending, choices])
+        pending, choices = pending[reachable], choices[reachable]
+        if not pending.size:
+            break
+
+        by_restaurant = np.lexsort((distances[pending, choices], choices))
+        pending, choices = pending[by_restaurant], choices[by_restaurant]
+        group_starts = np.flatnonzero(np.r_[True, choices[1:] != choices[:-1]])
+        group_sizes = np.diff(np.r_[group_starts, choices.size])
+        ranks = np.arange(choices.size) - np.repeat(group_starts, group_sizes)
+
+        accepted = ranks < free[choices]
+        assignment[pending[accepted]] = choices[accepted]
+        free -= np.bincount(choices[accepted], minlength=free.size)
+        distances[:, np.unique(choices[~accepted])] = np.inf
+        pending = pending[~accepted]
+    return assignment
+
+
+def plan_dispatch():
+    orders = list(
+        Order.objects
+        .filter(restaurant__isnull=True)
+        .exclude(status='completed')
+        .only('id', 'address', 'normalized_address')
+        .order_by('created_at', 'id')
+    )
+    restaurants = list(
+        Restaurant.objects
+        .filter(latitude__isnull=False, longitude__isnull=False)
+        .annotate(load=Count('orders', filter=~Q(orders__status='completed')))
+    )
+    if not orders or not restaurants:
+        return DispatchPlan(assignments=[], unassigned=orders)
+
+    product_ids_by_order = defaultdict(list)
+    items = OrderItem.objects.filter(order__in=orders).values_list('order_id', 'product_id')
+    for order_id, product_id in items:
+        product_ids_by_order[order_id].append(product_id)
+
+    coords_by_address = {
+        normalized_address: (float(latitude), float(longitude))
+        for normalized_address, latitude, longitude in Location.objects.filter(
+            normalized_address__in={order.normalized_address for order in orders},
+            latitude__isnull=False,
+            longitude__isnull=False,
+        ).values_list('normalized_address', 'latitude', 'longitude')
+    }
+    located_orders = [order for order in orders if order.normalized_address in coords_by_address]
+    unassigned = [order for order in orders if order.normalized_address not in coords_by_address]
+    if not located_orders:
+        return DispatchPlan(assignments=[], unassigned=unassigned)
+
+    column_by_restaurant = {restaurant.id: column for column, restaurant in enumerate(restaurants)}
+    available = np.zeros((len(located_orders), len(restaurants)), dtype=bool)
+    for row, order in enumerate(located_orders):
+        for restaurant_id in availability_index.restaurants_for(product_ids_by_order[order.id]):
+            if restaurant_id in column_by_restaurant:
+                available[row, column_by_restaurant[restaurant_id]] = True
+
+    distances = np.where(
+        available,
+        haversine_matrix(
+            [coords_by_address[order.normalized_address] for order in located_orders],
+            [(float(restaurant.latitude), float(restaurant.longitude)) for restaurant in restaurants],
+        ),
+        np.inf,
+    )
+    capacities = [
+        np.inf if restaurant.capacity is None else max(restaurant.capacity - restaurant.load, 0)
+        for restaurant in restaurants
+    ]
+    assignment = greedy_assignment(distances, capacities)
+
+    assignments = []
+    for row, column in enumerate(assignment):
+        if column < 0:
+            unassigned.append(located_orders[row])
+            continue
+        assignments.append(
+            (located_orders[row], restaurants[column], float(distances[row, column]))
+        )
+    return DispatchPlan(assignments=assignments, unassigned=unassigned)
+
+
+def apply_dispatch(plan):
+    with transaction.atomic():
+        still_unassigned = set(
+            Order.objects
+            .select_for_update()
+            .filter(pk__in=[order.id for order, _, _ in plan.assignments], restaurant__isnull=True)
+            .exclude(status='completed')
+            .values_list('id', flat=True)
+        )
+        orders = []
+        for order, restaurant, _ in plan.assignments:
+            if order.id not in still_unassigned:
+                continue
+            order.restaurant = restaurant
+            orders.append(order)
+            schedule_order_event(order.id, 'restaurant_assigned')
+        Order.objects.bulk_update(orders, ['restaurant'], batch_size=500)
+    return orders
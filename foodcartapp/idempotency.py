@@ -0,0 +1,55 @@
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def get_request_fingerprint(request):
+    # Запрос определяется представлением, а не путём: у register_order два
+    # адреса, и повтор через другой из них должен получить тот же ответ.
+    view_name = request.resolver_match.view_name
+    body = json.dumps(request.data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(f'{request.method} {view_name}\n{body}'.encode()).hexdigest()
+
+
+def get_expiration_boundary():
+    return timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+
+
+def claim_idempotency_key(key, fingerprint):
+    # Ключ занимается вставкой строки в транзакции, где создаётся заказ.
+    # Параллельный запрос с тем же ключом ждёт на уникальном индексе, пока
+    # первая транзакция не завершится, и затем получает её сохранённый ответ.
+    # Возвращает (запись, занят ли ключ этим запросом).
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(key=key, fingerprint=fingerprint), True
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(key=key).first()
+        if record is None:
+            continue
+        if record.created_at > get_expiration_boundary():
+            return record, False
+        IdempotencyKey.objects.filter(pk=record.pk).delete()
+    raise IntegrityError(f'Не удалось занять ключ идемпотентности {key}')
+
+
+def remember_response(record, status_code, body):
+    record.status_code = status_code
+    record.response_body = body
+    record.save(update_fields=['status_code', 'response_body'])
+
+
+def prune_idempotency_keys():
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lte=get_expiration_boundary()).delete()
+    return deleted
@@ -0,0 +1,286 @@
+import fcntl
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from decimal import Decimal
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Order, Product
+from .serializers import create_orders
+
+
+SEGMENT_PREFIX = 'orders-'
+SEGMENT_SUFFIX = '.jsonl'
+OFFSET_SUFFIX = '.offset'
+REJECTED_NAME = 'rejected.jsonl'
+ENTRY_FIELDS = {'intake_id', 'received_at', 'firstname', 'lastname', 'phonenumber', 'address', 'products'}
+ITEM_FIELDS = {'product', 'quantity', 'price'}
+
+
+class OrderJournal:
+    # Журнал принятых, но ещё не сохранённых в БД заказов. Каждый процесс
+    # пишет в свой файл-сегмент, по строке JSON на заказ. fsync выполняется
+    # группами: пока один поток ждёт диск, остальные дописывают свои строки,
+    # и следующий fsync подтверждает их все разом. Пока сегмент открыт,
+    # процесс держит на нём flock, и разборщик такой сегмент не удаляет.
+
+    def __init__(self, directory, group_commit_delay=0):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f'{SEGMENT_PREFIX}{uuid.uuid4().hex}{SEGMENT_SUFFIX}')
+        self.group_commit_delay = group_commit_delay
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | os.O_EXCL, 0o644)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        self._synced = threading.Condition()
+        self._written = 0
+        self._durable = 0
+        self._syncing = False
+
+    def append(self, entry):
+        line = json.dumps(entry, ensure_ascii=False, cls=DjangoJSONEncoder) + '\n'
+        data = memoryview(line.encode())
+        with self._synced:
+            while data:
+                data = data[os.write(self._fd, data):]
+            self._written += 1
+            position = self._written
+            while self._durable < position:
+                if self._syncing:
+                    self._synced.wait()
+                else:
+                    self._sync()
+
+    def close(self):
+        with self._synced:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def _sync(self):
+        # Вызывается под блокировкой, а сам fsync выполняется без неё, чтобы
+        # другие потоки могли дописывать строки в следующую группу.
+        self._syncing = True
+        self._synced.release()
+        synced = None
+        try:
+            if self.group_commit_delay:
+                time.sleep(self.group_commit_delay)
+            with self._synced:
+                target = self._written
+            os.fsync(self._fd)
+            synced = target
+        finally:
+            self._synced.acquire()
+            self._syncing = False
+            if synced is not None:
+                self._durable = max(self._durable, synced)
+            self._synced.notify_all()
+
+
+@lru_cache(maxsize=None)
+def get_journal(directory, pid):
+    return OrderJournal(directory, group_commit_delay=settings.ORDER_JOURNAL_GROUP_COMMIT_DELAY)
+
+
+def get_order_journal():
+    # После fork у дочернего процесса должен быть свой сегмент.
+    return get_journal(settings.ORDER_JOURNAL_DIR, os.getpid())
+
+
+def make_intake_id(idempotency_key=None):
+    # С ключом идемпотентности повтор запроса получает тот же номер, и
+    # разборщик журнала не создаст второй заказ.
+    if idempotency_key:
+        return hashlib.sha256(idempotency_key.encode()).hexdigest()[:32]
+    return uuid.uuid4().hex
+
+
+def build_journal_entry(intake_id, validated_data):
+    return {
+        'intake_id': intake_id,
+        'received_at': timezone.now(),
+        'firstname': validated_data['firstname'],
+        'lastname': validated_data['lastname'],
+        'phonenumber': str(validated_data['phonenumber']),
+        'address': validated_data['address'],
+        'products': [
+            {
+                'product': item_data['product'].id,
+                'quantity': item_data['quantity'],
+                'price': item_data['product'].price,
+            }
+            for item_data in validated_data['items']
+        ],
+    }
+
+
+def iter_segments(directory):
+    return sorted(glob.glob(os.path.join(directory, f'{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}')))
+
+
+def load_offset(segment):
+    try:
+        with open(segment + OFFSET_SUFFIX) as offset_file:
+            return int(offset_file.read() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def save_offset(segment, offset):
+    temporary_path = f'{segment}{OFFSET_SUFFIX}.tmp'
+    with open(temporary_path, 'w') as offset_file:
+        offset_file.write(str(offset))
+        offset_file.flush()
+        os.fsync(offset_file.fileno())
+    os.replace(temporary_path, segment + OFFSET_SUFFIX)
+
+
+def read_entries(segment, offset, limit):
+    # Читает только целые строки: недописанный хвост остаётся до следующего
+    # прохода. Возвращает записи, битые строки и смещение после прочитанного.
+    entries = []
+    broken = []
+    with open(segment, 'rb') as segment_file:
+        segment_file.seek(offset)
+        while len(entries) < limit:
+            line = segment_file.readline()
+            if not line.endswith(b'\n'):
+                break
+            offset += len(line)
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                entry = None
+            if is_valid_entry(entry):
+                entries.append(entry)
+            else:
+                broken.append(line.decode(errors='replace'))
+    return entries, broken, offset
+
+
+def is_valid_entry(entry):
+    # Запись без нужных полей иначе роняла бы каждый проход разборщика.
+    return (
+        isinstance(entry, dict)
+        and ENTRY_FIELDS <= entry.keys()
+        and isinstance(entry['products'], list)
+        and all(
+            isinstance(item, dict) and ITEM_FIELDS <= item.keys()
+            for item in entry['products']
+        )
+    )
+
+
+def reject_entries(directory, entries):
+    if not entries:
+        return
+    with open(os.path.join(directory, REJECTED_NAME), 'a') as rejected_file:
+        for entry in entries:
+            rejected_file.write(json.dumps(entry, ensure_ascii=False, cls=DjangoJSONEncoder) + '\n')
+        rejected_file.flush()
+        os.fsync(rejected_file.fileno())
+
+
+def get_order_data(entry, products_by_id):
+    items = []
+    for item in entry['products']:
+        product = products_by_id.get(item['product'])
+        if product is None:
+            return None
+        items.append({
+            'product': product,
+            'quantity': item['quantity'],
+            'price': Decimal(item['price']),
+        })
+    return {
+        'intake_id': entry['intake_id'],
+        'created_at': parse_datetime(entry['received_at']),
+        'firstname': entry['firstname'],
+        'lastname': entry['lastname'],
+        'phonenumber': entry['phonenumber'],
+        'address': entry['address'],
+        'items': items,
+    }
+
+
+def commit_entries(entries):
+    # Повторный разбор после сбоя безопасен: заказы, чей intake_id уже есть
+    # в БД, пропускаются. Возвращает созданные заказы и отклонённые записи.
+    with transaction.atomic():
+        existing_ids = set(
+            Order.objects
+            .filter(intake_id__in=[entry['intake_id'] for entry in entries])
+            .values_list('intake_id', flat=True)
+        )
+        products_by_id = Product.objects.in_bulk({
+            item['product'] for entry in entries for item in entry['products']
+        })
+
+        orders_data = []
+        rejected = []
+        for entry in entries:
+            if entry['intake_id'] in existing_ids:
+                continue
+            existing_ids.add(entry['intake_id'])
+            order_data = get_order_data(entry, products_by_id)
+            if order_data is None:
+                rejected.append(entry)
+            else:
+                orders_data.append(order_data)
+        orders = create_orders(orders_data) if orders_data else []
+    return orders, rejected
+
+
+def remove_abandoned_segment(segment):
+    # Удаляет полностью разобранный сегмент, если его писатель завершился:
+    # тогда flock на сегменте свободен. Блокировка берётся и в другом
+    # контейнере на той же машине, в отличие от проверки по pid.
+    fd = os.open(segment, os.O_RDONLY)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        if os.fstat(fd).st_size != load_offset(segment):
+            return False
+        os.remove(segment)
+        if os.path.exists(segment + OFFSET_SUFFIX):
+            os.remove(segment + OFFSET_SUFFIX)
+        return True
+    finally:
+        os.close(fd)
+
+
+def drain_order_journal(directory=None, batch_size=None):
+    # Переносит записи журнала в БД пачками. Смещение сегмента сохраняется
+    # только после коммита, поэтому сбой между ними приводит лишь к повторному
+    # чтению пачки. Разобранные сегменты умерших процессов удаляются.
+    directory = directory or settings.ORDER_JOURNAL_DIR
+    batch_size = batch_size or settings.ORDER_JOURNAL_DRAIN_BATCH
+    created = []
+    rejected_count = 0
+    for segment in iter_segments(directory):
+        offset = load_offset(segment)
+        while True:
+            entries, broken, new_offset = read_entries(segment, offset, batch_size)
+            if new_offset == offset:
+                break
+            orders, rejected = commit_entries(entries) if entries else ([], [])
+            reject_entries(directory, rejected + broken)
+            save_offset(segment, new_offset)
+            offset = new_offset
+            created.extend(orders)
+            rejected_count += len(rejected) + len(broken)
+
+        if offset == os.path.getsize(segment):
+            remove_abandoned_segment(segment)
+    return created, rejected_count
@@ -0,0 +1,80 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory, override_settings
+
+from foodcartapp.availability import availability_index
+from foodcartapp.catalog import bump_catalog_version
+from foodcartapp.models import Product, ProductCategory, Restaurant, RestaurantMenuItem
+from foodcartapp.views import product_list_api
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет размер ответа и время до первого байта /api/products/ '
+        'в разных режимах. Тестовые товары создаются в транзакции, '
+        'которая откатывается после замера.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10000)
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.seed(options['products'])
+            self.stdout.write(f'{"режим":<28}{"байт":>12}{"TTFB, мс":>12}{"всего, мс":>12}')
+            for compact in (False, True):
+                encoding = 'compact' if compact else 'indent'
+                with override_settings(
+                    COMPACT_JSON=compact,
+                    CATALOG_CHUNK_SIZE=options['chunk_size'],
+                ):
+                    with override_settings(CATALOG_SNAPSHOT=True):
+                        bump_catalog_version()
+                        self.report(f'{encoding}, snapshot cold', *self.measure())
+                        self.report(f'{encoding}, snapshot warm', *self.measure())
+                    with override_settings(CATALOG_SNAPSHOT=False):
+                        self.report(f'{encoding}, stream', *self.measure())
+            transaction.set_rollback(True)
+        bump_catalog_version()
+        availability_index.invalidate()
+
+    def seed(self, products_count):
+        category = ProductCategory.objects.create(name='bench')
+        restaurant = Restaurant.objects.create(name='bench')
+        Product.objects.bulk_create(
+            Product(
+                name=f'Товар {number}',
+                category=category,
+                price=100 + number % 500,
+                image='bench.jpg',
+                description='Описание тестового товара' * 3,
+            )
+            for number in range(products_count)
+        )
+        RestaurantMenuItem.objects.bulk_create(
+            RestaurantMenuItem(restaurant=restaurant, product=product)
+            for product in Product.objects.filter(category=category)
+        )
+        availability_index.invalidate()
+
+    def report(self, mode, size, ttfb, total):
+        self.stdout.write(f'{mode:<28}{size:>12}{ttfb * 1000:>12.1f}{total * 1000:>12.1f}')
+
+    def measure(self):
+        request = RequestFactory().get('/api/products/')
+
+        started_at = time.perf_counter()
+        response = product_list_api(request)
+        if response.streaming:
+            chunks = iter(response.streaming_content)
+            first_chunk = next(chunks)
+            ttfb = time.perf_counter() - started_at
+            size = len(first_chunk) + sum(len(chunk) for chunk in chunks)
+        else:
+            ttfb = time.perf_counter() - started_at
+            size = len(response.content)
+        total = time.perf_counter() - started_at
+        return size, ttfb, total
@@ -0,0 +1,74 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from foodcartapp.dispatch import greedy_assignment
+from geodata.distances import haversine_matrix
+
+
+def sequential_assignment(distances, capacities):
+    # Эталон для сравнения: обход всех пар заказ–ресторан по возрастанию
+    # расстояния в цикле на Python.
+    free = list(capacities)
+    assignment = np.full(distances.shape[0], -1)
+    rows, columns = np.nonzero(np.isfinite(distances))
+    for index in np.argsort(distances[rows, columns], kind='stable'):
+        row, column = rows[index], columns[index]
+        if assignment[row] < 0 and free[column] > 0:
+            assignment[row] = column
+            free[column] -= 1
+    return assignment
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет распределение заказов по ресторанам на случайных данных '
+        'в пределах Москвы, без обращения к БД.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=5000)
+        parser.add_argument('--restaurants', type=int, default=200)
+        parser.add_argument(
+            '--capacity',
+            type=int,
+            default=30,
+            help='Мощность каждого ресторана, 0 — без ограничений',
+        )
+        parser.add_argument(
+            '--availability',
+            type=float,
+            default=0.3,
+            help='Доля ресторанов, способных приготовить заказ',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        random = np.random.default_rng(options['seed'])
+        box_min, box_max = (55.55, 37.35), (55.95, 37.85)
+        order_coords = random.uniform(box_min, box_max, size=(options['orders'], 2))
+        restaurant_coords = random.uniform(box_min, box_max, size=(options['restaurants'], 2))
+        available = random.random((options['orders'], options['restaurants'])) < options['availability']
+
+        started_at = time.perf_counter()
+        distances = np.where(available, haversine_matrix(order_coords, restaurant_coords), np.inf)
+        matrix_time = time.perf_counter() - started_at
+        capacity = options['capacity'] or np.inf
+        capacities = np.full(options['restaurants'], capacity, dtype=float)
+
+        self.stdout.write(f'матрица расстояний: {matrix_time * 1000:.1f} мс')
+        self.stdout.write(f'{"алгоритм":<14}{"мс":>10}{"назначено":>12}{"всего, км":>12}{"в среднем, км":>16}')
+        for name, assign in (
+            ('раундами', greedy_assignment),
+            ('по парам', sequential_assignment),
+        ):
+            started_at = time.perf_counter()
+            assignment = assign(distances, capacities)
+            elapsed = time.perf_counter() - started_at
+            assigned = np.flatnonzero(assignment >= 0)
+            total_km = distances[assigned, assignment[assigned]].sum()
+            average_km = total_km / assigned.size if assigned.size else 0
+            self.stdout.write(
+                f'{name:<14}{elapsed * 1000:>10.1f}{assigned.size:>12}{total_km:>12.1f}{average_km:>16.2f}'
+            )
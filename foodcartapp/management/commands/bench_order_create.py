@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+
+from foodcartapp.models import Product, ProductCategory
+from foodcartapp.views import register_order
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет число запросов и время оформления заказа через API '
+        'для корзин разного размера. Тестовые данные создаются в '
+        'транзакции, которая откатывается после замера.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1, 5, 15, 50])
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        with transaction.atomic():
+            category = ProductCategory.objects.create(name='bench')
+            Product.objects.bulk_create(
+                Product(name=f'Товар {number}', category=category, price=100, image='bench.jpg')
+                for number in range(max(options['sizes']))
+            )
+            product_ids = list(
+                Product.objects.filter(category=category).order_by('pk').values_list('pk', flat=True)
+            )
+
+            self.stdout.write(f'{"позиций":>8}{"запросов":>10}{"мс":>10}')
+            for size in options['sizes']:
+                payload = {
+                    'firstname': 'Иван',
+                    'lastname': 'Петров',
+                    'phonenumber': '+79161234567',
+                    'address': 'Москва, Тверская улица, 1',
+                    'products': [
+                        {'product': product_id, 'quantity': 1}
+                        for product_id in product_ids[:size]
+                    ],
+                }
+                elapsed = 0
+                for _ in range(options['repeat']):
+                    request = factory.post('/api/order/', payload, format='json')
+                    with CaptureQueriesContext(connection) as queries:
+                        started_at = time.perf_counter()
+                        response = register_order(request)
+                        elapsed += time.perf_counter() - started_at
+                    assert response.status_code == 201, response.data
+                self.stdout.write(
+                    f'{size:>8}{len(queries):>10}{elapsed / options["repeat"] * 1000:>10.1f}'
+                )
+            transaction.set_rollback(True)
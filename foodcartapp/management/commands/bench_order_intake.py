@@ -0,0 +1,88 @@
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory
+
+from geodata.models import GeocodingJob
+
+from foodcartapp.journal import drain_order_journal
+from foodcartapp.models import Order, Product, ProductCategory
+from foodcartapp.views import register_order
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает, сколько заказов в секунду принимает API при записи сразу '
+        'в БД и через журнал приёма. Заказы сохраняются по-настоящему, чтобы '
+        'в замер попал коммит, и удаляются после замера вместе с товарами и '
+        'задачей геокодирования. События заказов уходят в ленту в памяти и на '
+        'странице менеджера не появляются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1000)
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--items', type=int, default=3)
+
+    def handle(self, *args, **options):
+        category = ProductCategory.objects.create(name='bench')
+        Product.objects.bulk_create(
+            Product(name=f'Товар {number}', category=category, price=100, image='bench.jpg')
+            for number in range(options['items'])
+        )
+        product_ids = Product.objects.filter(category=category).values_list('pk', flat=True)
+        # Уникальный адрес, чтобы не трогать задачу геокодирования настоящего.
+        address = f'Москва, улица Бенчмарк, {uuid.uuid4().hex[:8]}'
+        payload = {
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79161234567',
+            'address': address,
+            'products': [{'product': product_id, 'quantity': 1} for product_id in product_ids],
+        }
+
+        with override_settings(ORDER_FEED='foodcartapp.order_feed.MemoryOrderFeed'):
+            try:
+                self.run_bench(payload, options)
+            finally:
+                Order.objects.filter(items__product__category=category).delete()
+                Product.objects.filter(category=category).delete()
+                category.delete()
+                GeocodingJob.objects.filter(address=address).delete()
+
+    def run_bench(self, payload, options):
+        self.stdout.write(f'{"режим":>12}{"заказов":>10}{"ошибок":>10}{"сек":>10}{"заказов/с":>12}')
+        with override_settings(ORDER_INTAKE_JOURNAL=False):
+            self.report('сразу в БД', *self.post_orders(payload, options))
+
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(ORDER_INTAKE_JOURNAL=True, ORDER_JOURNAL_DIR=directory):
+                self.report('журнал', *self.post_orders(payload, options))
+                started_at = time.perf_counter()
+                orders, rejected = drain_order_journal(directory)
+                self.report('разбор', len(orders), rejected, time.perf_counter() - started_at)
+
+    def post_orders(self, payload, options):
+        factory = APIRequestFactory()
+
+        def post_order(_):
+            try:
+                request = factory.post('/api/order/', payload, format='json')
+                return register_order(request).status_code
+            finally:
+                connection.close()
+
+        started_at = time.perf_counter()
+        with ThreadPoolExecutor(options['threads']) as executor:
+            statuses = list(executor.map(post_order, range(options['orders'])))
+        elapsed = time.perf_counter() - started_at
+        failed = sum(1 for status in statuses if status >= 400)
+        return len(statuses) - failed, failed, elapsed
+
+    def report(self, mode, count, failed, elapsed):
+        self.stdout.write(f'{mode:>12}{count:>10}{failed:>10}{elapsed:>10.2f}{count / elapsed:>12.0f}')
@@ -0,0 +1,40 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from foodcartapp.dispatch import apply_dispatch, plan_dispatch
+
+
+class Command(BaseCommand):
+    help = (
+        'Назначает рестораны открытым заказам без ресторана так, чтобы '
+        'суммарное расстояние доставки было поменьше, а рестораны не '
+        'получали заказов больше своей мощности.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать распределение, ничего не сохранять',
+        )
+
+    def handle(self, *args, **options):
+        plan = plan_dispatch()
+        total_km = sum(km for _, _, km in plan.assignments)
+        loads = Counter(restaurant.name for _, restaurant, _ in plan.assignments)
+
+        if options['verbosity'] > 1:
+            for order, restaurant, km in plan.assignments:
+                self.stdout.write(f'{order.id}\t{order.address}\t{restaurant.name}\t{km:.2f} км')
+        for name, count in loads.most_common():
+            self.stdout.write(f'{name}: {count}')
+        self.stdout.write(
+            f'Распределено заказов: {len(plan.assignments)}, '
+            f'суммарно {total_km:.1f} км. Без ресторана: {len(plan.unassigned)}'
+        )
+
+        if options['dry_run']:
+            return
+        assigned = apply_dispatch(plan)
+        self.stdout.write(f'Сохранено назначений: {len(assigned)}')
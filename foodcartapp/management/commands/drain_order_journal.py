@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from foodcartapp.journal import drain_order_journal
+
+
+class Command(BaseCommand):
+    help = 'Переносит заказы из журнала приёма в базу данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directory', default=None, help='По умолчанию ORDER_JOURNAL_DIR')
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--sleep', type=float, default=0.5, help='Пауза, когда журнал пуст, сек.')
+        parser.add_argument('--once', action='store_true', help='Разобрать журнал один раз и выйти')
+
+    def handle(self, *args, **options):
+        directory = options['directory'] or settings.ORDER_JOURNAL_DIR
+        while True:
+            orders, rejected = drain_order_journal(directory, options['batch_size'])
+            if orders or rejected:
+                self.stdout.write(f'Сохранено заказов: {len(orders)}, отклонено: {rejected}')
+
+            if options['once']:
+                break
+            if not orders and not rejected:
+                time.sleep(options['sleep'])
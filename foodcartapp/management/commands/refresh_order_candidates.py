@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from foodcartapp.candidates import get_open_order_ids, refresh_order_candidates
+
+
+class Command(BaseCommand):
+    help = (
+        'Заново рассчитывает рестораны и расстояния для всех открытых заказов. '
+        'Нужен после миграции и после массовых правок в обход сигналов.'
+    )
+
+    def handle(self, *args, **options):
+        order_ids = list(get_open_order_ids())
+        refresh_order_candidates(order_ids)
+        self.stdout.write(f'Пересчитано открытых заказов: {len(order_ids)}')
@@ -0,0 +1,39 @@
+import requests
+from django.core.management.base import BaseCommand
+
+from foodcartapp.candidates import get_open_order_ids, refresh_order_candidates
+from foodcartapp.models import Restaurant
+from foodcartapp.restaurant_index import invalidate_restaurant_index
+from geodata.addresses import normalize_address
+from geodata.utils import get_or_create_location
+
+
+class Command(BaseCommand):
+    help = (
+        'Записывает в рестораны координаты их адресов. Адреса, которых ещё '
+        'нет в кэше координат, геокодируются.'
+    )
+
+    def handle(self, *args, **options):
+        restaurants = list(Restaurant.objects.exclude(address=''))
+        for restaurant in restaurants:
+            restaurant.normalized_address = normalize_address(restaurant.address)
+            try:
+                location = get_or_create_location(restaurant.address)
+            except requests.RequestException as error:
+                self.stderr.write(f'{restaurant.name}: {error}')
+                continue
+            restaurant.location = location
+            restaurant.latitude = location.latitude
+            restaurant.longitude = location.longitude
+            if location.latitude is None:
+                self.stderr.write(f'{restaurant.name}: адрес не найден')
+
+        Restaurant.objects.bulk_update(
+            restaurants,
+            ['normalized_address', 'location', 'latitude', 'longitude'],
+        )
+        invalidate_restaurant_index()
+        refresh_order_candidates(get_open_order_ids())
+        located = sum(1 for restaurant in restaurants if restaurant.latitude is not None)
+        self.stdout.write(f'Координаты есть у {located} из {len(restaurants)} ресторанов')
@@ -0,0 +1,85 @@
+# Generated by Django 3.2.15 on 2026-10-18 18:26
+
+import re
+
+from django.db import migrations, models
+
+
+# Нормализация адреса в том виде, в каком она была при создании миграции.
+ABBREVIATIONS = {
+    'ул': 'улица',
+    'пр': 'проспект',
+    'пр-т': 'проспект',
+    'просп': 'проспект',
+    'пр-д': 'проезд',
+    'пер': 'переулок',
+    'пл': 'площадь',
+    'наб': 'набережная',
+    'ш': 'шоссе',
+    'б-р': 'бульвар',
+    'бул': 'бульвар',
+    'туп': 'тупик',
+    'мкр': 'микрорайон',
+    'мкр-н': 'микрорайон',
+    'обл': 'область',
+    'корп': 'корпус',
+    'к': 'корпус',
+    'стр': 'строение',
+    'кв': 'квартира',
+    'г': 'город',
+    'д': 'дом',
+}
+
+NOISE_WORDS = {'город', 'дом'}
+
+TOKEN_PATTERN = re.compile(r'[\w/]+(?:-[\w/]+)*')
+
+
+def normalize_address(address):
+    address = address.casefold().replace('ё', 'е')
+    tokens = (
+        ABBREVIATIONS.get(token, token)
+        for token in TOKEN_PATTERN.findall(address)
+    )
+    return ' '.join(token for token in tokens if token not in NOISE_WORDS)
+
+
+def fill_restaurant_coordinates(apps, schema_editor):
+    Restaurant = apps.get_model('foodcartapp', 'Restaurant')
+    Location = apps.get_model('geodata', 'Location')
+
+    restaurants = list(Restaurant.objects.all())
+    locations = Location.objects.filter(
+        normalized_address__in=[normalize_address(restaurant.address) for restaurant in restaurants],
+        latitude__isnull=False,
+        longitude__isnull=False,
+    )
+    location_by_address = {location.normalized_address: location for location in locations}
+    for restaurant in restaurants:
+        location = location_by_address.get(normalize_address(restaurant.address))
+        if location:
+            restaurant.latitude = location.latitude
+            restaurant.longitude = location.longitude
+    Restaurant.objects.bulk_update(restaurants, ['latitude', 'longitude'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geodata', '0005_location_single_flight'),
+        ('foodcartapp', '0051_alter_orderitem_quantity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='latitude',
+            field=models.DecimalField(blank=True, decimal_places=6, editable=False, max_digits=9, null=True, verbose_name='широта'),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='longitude',
+            field=models.DecimalField(blank=True, decimal_places=6, editable=False, max_digits=9, null=True, verbose_name='долгота'),
+        ),
+        migrations.RunPython(fill_restaurant_coordinates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 3.2.15 on 2026-10-18 18:27
+
+import re
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Своя копия нормализации, чтобы миграция не менялась вместе с geodata.
+ABBREVIATIONS = {
+    'ул': 'улица',
+    'пр': 'проспект',
+    'пр-т': 'проспект',
+    'просп': 'проспект',
+    'пр-д': 'проезд',
+    'пер': 'переулок',
+    'пл': 'площадь',
+    'наб': 'набережная',
+    'ш': 'шоссе',
+    'б-р': 'бульвар',
+    'бул': 'бульвар',
+    'туп': 'тупик',
+    'мкр': 'микрорайон',
+    'мкр-н': 'микрорайон',
+    'обл': 'область',
+    'корп': 'корпус',
+    'к': 'корпус',
+    'стр': 'строение',
+    'кв': 'квартира',
+    'г': 'город',
+    'д': 'дом',
+}
+
+NOISE_WORDS = {'город', 'дом'}
+
+TOKEN_PATTERN = re.compile(r'[\w/]+(?:-[\w/]+)*')
+
+
+def normalize_address(address):
+    address = address.casefold().replace('ё', 'е')
+    tokens = (
+        ABBREVIATIONS.get(token, token)
+        for token in TOKEN_PATTERN.findall(address)
+    )
+    return ' '.join(token for token in tokens if token not in NOISE_WORDS)
+
+
+def fill_restaurant_locations(apps, schema_editor):
+    Restaurant = apps.get_model('foodcartapp', 'Restaurant')
+    Location = apps.get_model('geodata', 'Location')
+
+    restaurants = list(Restaurant.objects.all())
+    location_ids = dict(
+        Location.objects
+        .filter(normalized_address__in=[normalize_address(restaurant.address) for restaurant in restaurants])
+        .values_list('normalized_address', 'id')
+    )
+    for restaurant in restaurants:
+        restaurant.location_id = location_ids.get(normalize_address(restaurant.address))
+    Restaurant.objects.bulk_update(restaurants, ['location'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geodata', '0006_distance'),
+        ('foodcartapp', '0052_restaurant_coordinates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='location',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='restaurants', to='geodata.location', verbose_name='координаты адреса'),
+        ),
+        migrations.RunPython(fill_restaurant_locations, migrations.RunPython.noop),
+    ]
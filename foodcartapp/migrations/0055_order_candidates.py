@@ -0,0 +1,173 @@
+# Generated by Django 3.2.15 on 2026-10-18 19:05
+
+import math
+import re
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+# Нормализация адреса из geodata.addresses на момент создания миграции.
+ABBREVIATIONS = {
+    'ул': 'улица',
+    'пр': 'проспект',
+    'пр-т': 'проспект',
+    'просп': 'проспект',
+    'пр-д': 'проезд',
+    'пер': 'переулок',
+    'пл': 'площадь',
+    'наб': 'набережная',
+    'ш': 'шоссе',
+    'б-р': 'бульвар',
+    'бул': 'бульвар',
+    'туп': 'тупик',
+    'мкр': 'микрорайон',
+    'мкр-н': 'микрорайон',
+    'обл': 'область',
+    'корп': 'корпус',
+    'к': 'корпус',
+    'стр': 'строение',
+    'кв': 'квартира',
+    'г': 'город',
+    'д': 'дом',
+}
+
+NOISE_WORDS = {'город', 'дом'}
+
+TOKEN_PATTERN = re.compile(r'[\w/]+(?:-[\w/]+)*')
+
+
+def normalize_address(address):
+    address = address.casefold().replace('ё', 'е')
+    tokens = (
+        ABBREVIATIONS.get(token, token)
+        for token in TOKEN_PATTERN.findall(address)
+    )
+    return ' '.join(token for token in tokens if token not in NOISE_WORDS)
+
+
+def haversine(origin, destination):
+    lat1, lon1, lat2, lon2 = map(math.radians, (*origin, *destination))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1)))
+
+
+def fill_normalized_addresses(apps, schema_editor):
+    Order = apps.get_model('foodcartapp', 'Order')
+    orders = list(Order.objects.only('id', 'address'))
+    for order in orders:
+        order.normalized_address = normalize_address(order.address)
+    Order.objects.bulk_update(orders, ['normalized_address'], batch_size=500)
+
+
+def fill_order_candidates(apps, schema_editor):
+    # Первичное заполнение таблицы, дальше её поддерживают сигналы. Как и
+    # candidates.build_order_candidates: рестораны без координат попадают в
+    # кандидаты без расстояния, а с координатами — только ближайшие.
+    Order = apps.get_model('foodcartapp', 'Order')
+    OrderItem = apps.get_model('foodcartapp', 'OrderItem')
+    OrderCandidate = apps.get_model('foodcartapp', 'OrderCandidate')
+    Restaurant = apps.get_model('foodcartapp', 'Restaurant')
+    RestaurantMenuItem = apps.get_model('foodcartapp', 'RestaurantMenuItem')
+    Location = apps.get_model('geodata', 'Location')
+
+    orders = list(Order.objects.exclude(status='completed').only('id', 'normalized_address'))
+    product_ids_by_order = defaultdict(set)
+    items = OrderItem.objects.filter(order__in=orders).values_list('order_id', 'product_id')
+    for order_id, product_id in items:
+        product_ids_by_order[order_id].add(product_id)
+
+    product_ids_by_restaurant = defaultdict(set)
+    menu_items = RestaurantMenuItem.objects.filter(availability=True).values_list('restaurant_id', 'product_id')
+    for restaurant_id, product_id in menu_items:
+        product_ids_by_restaurant[restaurant_id].add(product_id)
+
+    restaurant_coords = {
+        restaurant_id: (float(latitude), float(longitude))
+        for restaurant_id, latitude, longitude in Restaurant.objects.filter(
+            latitude__isnull=False,
+            longitude__isnull=False,
+        ).values_list('id', 'latitude', 'longitude')
+    }
+    location_coords = {
+        normalized_address: (float(latitude), float(longitude))
+        for normalized_address, latitude, longitude in Location.objects.filter(
+            normalized_address__in={order.normalized_address for order in orders},
+            latitude__isnull=False,
+            longitude__isnull=False,
+        ).values_list('normalized_address', 'latitude', 'longitude')
+    }
+
+    candidates = []
+    for order in orders:
+        product_ids = product_ids_by_order[order.id]
+        restaurant_ids = [
+            restaurant_id
+            for restaurant_id, restaurant_product_ids in product_ids_by_restaurant.items()
+            if product_ids and product_ids <= restaurant_product_ids
+        ]
+        order_coords = location_coords.get(order.normalized_address)
+        if order_coords is None:
+            candidates.extend(
+                OrderCandidate(order_id=order.id, restaurant_id=restaurant_id)
+                for restaurant_id in restaurant_ids
+            )
+            continue
+
+        distances = []
+        for restaurant_id in restaurant_ids:
+            if restaurant_id not in restaurant_coords:
+                candidates.append(OrderCandidate(order_id=order.id, restaurant_id=restaurant_id))
+                continue
+            distance = haversine(order_coords, restaurant_coords[restaurant_id])
+            if settings.DELIVERY_RADIUS_KM is None or distance <= settings.DELIVERY_RADIUS_KM:
+                distances.append((distance, restaurant_id))
+        candidates.extend(
+            OrderCandidate(order_id=order.id, restaurant_id=restaurant_id, distance=round(distance, 2))
+            for distance, restaurant_id in sorted(distances)[:settings.NEAREST_RESTAURANTS_LIMIT]
+        )
+    OrderCandidate.objects.bulk_create(candidates, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0054_order_status_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='normalized_address',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255, verbose_name='Нормализованный адрес'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_normalized_addresses, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='OrderCandidate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('distance', models.FloatField(blank=True, null=True, verbose_name='Расстояние, км')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='candidates', to='foodcartapp.order', verbose_name='Заказ')),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_candidates', to='foodcartapp.restaurant', verbose_name='Ресторан')),
+            ],
+            options={
+                'verbose_name': 'ресторан для заказа',
+                'verbose_name_plural': 'рестораны для заказов',
+                'unique_together': {('order', 'restaurant')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='ordercandidate',
+            index=models.Index(fields=['order', 'distance'], name='order_candidate_distance_idx'),
+        ),
+        migrations.RunPython(fill_order_candidates, migrations.RunPython.noop),
+    ]
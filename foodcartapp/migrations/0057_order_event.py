@@ -0,0 +1,28 @@
+# Generated by Django 3.2.15 on 2026-10-18 18:33
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0056_order_total_cost'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_id', models.IntegerField(verbose_name='ID заказа')),
+                ('kind', models.CharField(choices=[('added', 'Новый заказ'), ('status_changed', 'Сменился статус'), ('restaurant_assigned', 'Назначен ресторан'), ('items_changed', 'Изменился состав'), ('deleted', 'Заказ удалён')], max_length=20, verbose_name='Событие')),
+                ('data', models.JSONField(default=dict, verbose_name='Данные')),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Создано')),
+            ],
+            options={
+                'verbose_name': 'событие заказа',
+                'verbose_name_plural': 'события заказов',
+            },
+        ),
+    ]
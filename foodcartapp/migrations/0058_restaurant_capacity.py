@@ -0,0 +1,18 @@
+# Generated by Django 3.2.15 on 2026-10-18 18:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0057_order_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='capacity',
+            field=models.PositiveIntegerField(blank=True, help_text='Сколько открытых заказов ресторан готовит одновременно. Пусто — без ограничений', null=True, verbose_name='мощность'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.15 on 2026-10-18 18:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0059_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='intake_id',
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True, unique=True, verbose_name='Номер в журнале приёма'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.2.15 on 2026-10-18 18:51
+
+import phonenumbers
+from django.db import migrations, models
+
+
+def normalize_phonenumber(phonenumber):
+    # Как foodcartapp.phones.normalize_phonenumber на момент миграции, но без
+    # импорта кода приложения.
+    if not phonenumber:
+        return ''
+    try:
+        parsed = phonenumbers.parse(str(phonenumber), 'RU')
+    except phonenumbers.NumberParseException:
+        return ''
+    if not phonenumbers.is_valid_number(parsed):
+        return ''
+    return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
+
+
+def fill_phonenumbers_e164(apps, schema_editor):
+    Order = apps.get_model('foodcartapp', 'Order')
+    orders = list(Order.objects.only('id', 'phonenumber'))
+    for order in orders:
+        order.phonenumber_e164 = normalize_phonenumber(order.phonenumber)
+    Order.objects.bulk_update(orders, ['phonenumber_e164'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0060_order_intake_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='phonenumber_e164',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=20, verbose_name='Телефон в формате E.164'),
+        ),
+        migrations.RunPython(fill_phonenumbers_e164, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 3.2.15 on 2026-10-18 19:25
+
+import re
+
+from django.db import migrations, models
+
+
+ABBREVIATIONS = {
+    'ул': 'улица',
+    'пр': 'проспект',
+    'пр-т': 'проспект',
+    'просп': 'проспект',
+    'пр-д': 'проезд',
+    'пер': 'переулок',
+    'пл': 'площадь',
+    'наб': 'набережная',
+    'ш': 'шоссе',
+    'б-р': 'бульвар',
+    'бул': 'бульвар',
+    'туп': 'тупик',
+    'мкр': 'микрорайон',
+    'мкр-н': 'микрорайон',
+    'обл': 'область',
+    'корп': 'корпус',
+    'к': 'корпус',
+    'стр': 'строение',
+    'кв': 'квартира',
+    'г': 'город',
+    'д': 'дом',
+}
+
+NOISE_WORDS = {'город', 'дом'}
+
+TOKEN_PATTERN = re.compile(r'[\w/]+(?:-[\w/]+)*')
+
+
+def normalize_address(address):
+    address = address.casefold().replace('ё', 'е')
+    tokens = (
+        ABBREVIATIONS.get(token, token)
+        for token in TOKEN_PATTERN.findall(address)
+    )
+    return ' '.join(token for token in tokens if token not in NOISE_WORDS)
+
+
+def fill_normalized_addresses(apps, schema_editor):
+    Restaurant = apps.get_model('foodcartapp', 'Restaurant')
+    restaurants = list(Restaurant.objects.only('id', 'address'))
+    for restaurant in restaurants:
+        restaurant.normalized_address = normalize_address(restaurant.address)
+    Restaurant.objects.bulk_update(restaurants, ['normalized_address'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0061_order_phonenumber_e164'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='normalized_address',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255, verbose_name='нормализованный адрес'),
+        ),
+        migrations.RunPython(fill_normalized_addresses, migrations.RunPython.noop),
+    ]
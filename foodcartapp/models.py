@@ -1,9 +1,15 @@
 from django.db import models
-from django.db.models import F, Sum
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.core.validators import MinValueValidator, MaxValueValidator
 from phonenumber_field.modelfields import PhoneNumberField
 from django.utils import timezone
 
+from geodata.addresses import normalize_address
+
+from .availability import availability_index
+from .phones import normalize_phonenumber
+
 
 class Restaurant(models.Model):
     name = models.CharField(
@@ -17,11 +23,49 @@ class Restaurant(models.Model):
         blank=True,
         db_index=True,
     )
+    normalized_address = models.CharField(
+        'нормализованный адрес',
+        max_length=255,
+        blank=True,
+        db_index=True,
+        editable=False,
+    )
     contact_phone = models.CharField(
         'контактный телефон',
         max_length=50,
         blank=True,
     )
+    location = models.ForeignKey(
+        'geodata.Location',
+        verbose_name='координаты адреса',
+        related_name='restaurants',
+        null=True,
+        blank=True,
+        editable=False,
+        on_delete=models.SET_NULL,
+    )
+    latitude = models.DecimalField(
+        'широта',
+        max_digits=9,
+        decimal_places=6,
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    longitude = models.DecimalField(
+        'долгота',
+        max_digits=9,
+        decimal_places=6,
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    capacity = models.PositiveIntegerField(
+        'мощность',
+        null=True,
+        blank=True,
+        help_text='Сколько открытых заказов ресторан готовит одновременно. Пусто — без ограничений',
+    )
 
     class Meta:
         verbose_name = 'ресторан'
@@ -30,15 +74,26 @@ class Restaurant(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.normalized_address = normalize_address(self.address)
+        super().save(*args, **kwargs)
+
+
+# Дальше список id в запросе становится длиннее подзапроса и упирается в
+# лимит переменных SQLite.
+AVAILABLE_IDS_LIMIT = 500
+
 
 class ProductQuerySet(models.QuerySet):
     def available(self):
-        products = (
-            RestaurantMenuItem.objects
-            .filter(availability=True)
-            .values_list('product')
-        )
-        return self.filter(pk__in=products)
+        product_ids = availability_index.available_product_ids()
+        if len(product_ids) > AVAILABLE_IDS_LIMIT:
+            return self.filter(
+                pk__in=RestaurantMenuItem.objects
+                .filter(availability=True)
+                .values('product_id')
+            )
+        return self.filter(pk__in=product_ids)
 
 
 class ProductCategory(models.Model):
@@ -130,17 +185,45 @@ class RestaurantMenuItem(models.Model):
 
 
 class OrderQuerySet(models.QuerySet):
-    def total_cost(self):
-        return self.annotate(
-            total_cost=Sum(F('items__quantity') * F('items__product__price'))
+    def recalculate_total_cost(self):
+        items_cost = (
+            OrderItem.objects
+            .filter(order=OuterRef('pk'))
+            .values('order')
+            .annotate(cost=Sum(F('quantity') * F('price'), output_field=DecimalField()))
+            .values('cost')
         )
+        return self.update(
+            total_cost=Coalesce(Subquery(items_cost), Value(0), output_field=DecimalField())
+        )
+
+    def by_phonenumber(self, phonenumber):
+        # Поиск заказов клиента по номеру в любом написании: 8 (916) 123-45-67
+        # и +79161234567 дают один и тот же номер в E.164.
+        phonenumber_e164 = normalize_phonenumber(phonenumber)
+        if not phonenumber_e164:
+            return self.none()
+        return self.filter(phonenumber_e164=phonenumber_e164)
 
 
 class Order(models.Model):
     firstname = models.CharField('Имя', max_length=255, db_index=True,)
     lastname = models.CharField('Фамилия', max_length=255)
     phonenumber = PhoneNumberField('Телефон', region='RU', db_index=True,)
+    phonenumber_e164 = models.CharField(
+        'Телефон в формате E.164',
+        max_length=20,
+        blank=True,
+        db_index=True,
+        editable=False,
+    )
     address = models.CharField('адрес', max_length=255, db_index=True,)
+    normalized_address = models.CharField(
+        'Нормализованный адрес',
+        max_length=255,
+        db_index=True,
+        editable=False,
+    )
     created_at = models.DateTimeField(
         'Дата создания заказа',
         default=timezone.now,
@@ -196,6 +279,16 @@ class Order(models.Model):
 
     comment = models.TextField('Комантарий', blank=True, null=True)
 
+    total_cost = models.DecimalField(
+        'Стоимость заказа',
+        max_digits=10,
+        decimal_places=2,
+        default=0,
+        editable=False,
+        db_index=True,
+        validators=[MinValueValidator(0)]
+    )
+
     restaurant = models.ForeignKey(
         Restaurant,
         verbose_name='Ресторан',
@@ -205,15 +298,35 @@ class Order(models.Model):
         related_name='orders'
     )
 
+    intake_id = models.CharField(
+        'Номер в журнале приёма',
+        max_length=32,
+        unique=True,
+        null=True,
+        blank=True,
+        editable=False,
+    )
+
     objects = OrderQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'заказ'
         verbose_name_plural = 'заказы'
+        indexes = [
+            models.Index(
+                fields=['status', 'created_at', 'id'],
+                name='order_status_created_id_idx',
+            ),
+        ]
 
     def __str__(self):
         return f'{self.firstname} {self.lastname}'
 
+    def save(self, *args, **kwargs):
+        self.normalized_address = normalize_address(self.address)
+        self.phonenumber_e164 = normalize_phonenumber(self.phonenumber)
+        super().save(*args, **kwargs)
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(
@@ -248,4 +361,75 @@ class OrderItem(models.Model):
         verbose_name_plural = 'элементы заказа'
 
     def __str__(self):
-        return f'{self.product.name} - {self.quantity} шт.'
\ No newline at end of file
+        return f'{self.product.name} - {self.quantity} шт.'
+
+
+class OrderCandidate(models.Model):
+    # Рестораны, которые могут приготовить открытый заказ, вместе с расстоянием
+    # до клиента. Таблица поддерживается сигналами, см. candidates.py.
+    order = models.ForeignKey(
+        Order,
+        related_name='candidates',
+        verbose_name='Заказ',
+        on_delete=models.CASCADE,
+    )
+    restaurant = models.ForeignKey(
+        Restaurant,
+        related_name='order_candidates',
+        verbose_name='Ресторан',
+        on_delete=models.CASCADE,
+    )
+    distance = models.FloatField('Расстояние, км', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'ресторан для заказа'
+        verbose_name_plural = 'рестораны для заказов'
+        unique_together = [
+            ['order', 'restaurant']
+        ]
+        indexes = [
+            models.Index(
+                fields=['order', 'distance'],
+                name='order_candidate_distance_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.order} - {self.restaurant}'
+
+
+class OrderEvent(models.Model):
+    KIND_CHOICES = [
+        ('added', 'Новый заказ'),
+        ('status_changed', 'Сменился статус'),
+        ('restaurant_assigned', 'Назначен ресторан'),
+        ('items_changed', 'Изменился состав'),
+        ('deleted', 'Заказ удалён'),
+    ]
+
+    order_id = models.IntegerField('ID заказа')
+    kind = models.CharField('Событие', max_length=20, choices=KIND_CHOICES)
+    data = models.JSONField('Данные', default=dict)
+    created_at = models.DateTimeField('Создано', default=timezone.now, db_index=True)
+
+    class Meta:
+        verbose_name = 'событие заказа'
+        verbose_name_plural = 'события заказов'
+
+    def __str__(self):
+        return f'{self.order_id}: {self.get_kind_display()}'
+
+
+class IdempotencyKey(models.Model):
+    key = models.CharField('ключ', max_length=255, unique=True)
+    fingerprint = models.CharField('отпечаток запроса', max_length=64)
+    status_code = models.PositiveSmallIntegerField('код ответа', null=True, blank=True)
+    response_body = models.JSONField('тело ответа', null=True, blank=True)
+    created_at = models.DateTimeField('создан', default=timezone.now, db_index=True)
+
+    class Meta:
+        verbose_name = 'ключ идемпотентности'
+        verbose_name_plural = 'ключи идемпотентности'
+
+    def __str__(self):
+        return self.key
@@ -0,0 +1,180 @@
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Order, OrderEvent
+
+
+PRUNE_EVERY = 1000
+
+_pending = threading.local()
+
+
+class BaseOrderFeed:
+    # Лента изменений заказов. У каждого события есть возрастающий id, по
+    # которому клиент запрашивает всё, что случилось после него.
+
+    def publish(self, kind, order_id, data):
+        raise NotImplementedError
+
+    def read(self, after, limit=100):
+        raise NotImplementedError
+
+    def last_id(self):
+        raise NotImplementedError
+
+    def wait(self, after, timeout):
+        raise NotImplementedError
+
+
+class MemoryOrderFeed(BaseOrderFeed):
+    # Лента в памяти процесса: для тестов и запуска в один процесс.
+
+    def __init__(self, maxlen=1000):
+        self._events = deque(maxlen=maxlen)
+        self._last_id = 0
+        self._changed = threading.Condition()
+
+    def publish(self, kind, order_id, data):
+        with self._changed:
+            self._last_id += 1
+            event = {'id': self._last_id, 'kind': kind, 'order_id': order_id, 'data': data}
+            self._events.append(event)
+            self._changed.notify_all()
+        return event
+
+    def read(self, after, limit=100):
+        with self._changed:
+            return [event for event in self._events if event['id'] > after][:limit]
+
+    def last_id(self):
+        with self._changed:
+            return self._last_id
+
+    def wait(self, after, timeout):
+        with self._changed:
+            self._changed.wait_for(lambda: self._last_id > after, timeout=timeout)
+        return self.read(after)
+
+
+class DatabaseOrderFeed(BaseOrderFeed):
+    # Лента в таблице OrderEvent, общая для всех процессов. Ожидание новых
+    # событий — опрос таблицы раз в ORDER_FEED_POLL_INTERVAL секунд по индексу
+    # первичного ключа.
+
+    def publish(self, kind, order_id, data):
+        event = OrderEvent.objects.create(kind=kind, order_id=order_id, data=data)
+        if event.id % PRUNE_EVERY == 0:
+            OrderEvent.objects.filter(
+                created_at__lt=timezone.now() - timedelta(seconds=settings.ORDER_FEED_RETENTION)
+            ).delete()
+        return serialize_event(event)
+
+    def read(self, after, limit=100):
+        events = OrderEvent.objects.filter(id__gt=after).order_by('id')[:limit]
+        return [serialize_event(event) for event in events]
+
+    def last_id(self):
+        return OrderEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+    def wait(self, after, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            events = self.read(after)
+            remaining = deadline - time.monotonic()
+            if events or remaining <= 0:
+                return events
+            time.sleep(min(settings.ORDER_FEED_POLL_INTERVAL, remaining))
+
+
+def serialize_event(event):
+    return {
+        'id': event.id,
+        'kind': event.kind,
+        'order_id': event.order_id,
+        'data': event.data,
+    }
+
+
+@lru_cache(maxsize=None)
+def get_feed(path):
+    return import_string(path)()
+
+
+def get_order_feed():
+    return get_feed(settings.ORDER_FEED)
+
+
+def get_event_data(kind, order):
+    if kind == 'added':
+        return {
+            'firstname': order.firstname,
+            'lastname': order.lastname,
+            'address': order.address,
+            'status': order.get_status_display(),
+            'total_cost': str(order.total_cost),
+        }
+    if kind == 'status_changed':
+        return {'status': order.status, 'status_display': order.get_status_display()}
+    if kind == 'restaurant_assigned':
+        return {'restaurant': order.restaurant.name if order.restaurant else None}
+    if kind == 'items_changed':
+        return {'total_cost': str(order.total_cost)}
+    return {}
+
+
+def schedule_order_event(order_id, kind):
+    # События копятся до коммита: данные берутся из уже сохранённого заказа,
+    # а новый заказ с позициями превращается в одно событие added. Пачка
+    # привязана к своему обработчику on_commit: если транзакцию откатили,
+    # Django выбрасывает обработчик, и следующий вызов начинает новую пачку.
+    batch = getattr(_pending, 'batch', None)
+    is_new_batch = batch is None or not is_pending_on_commit(batch)
+    if is_new_batch:
+        batch = _pending.batch = OrderEventBatch()
+    kinds = batch.kinds.setdefault(order_id, [])
+    if kind not in kinds:
+        kinds.append(kind)
+    if is_new_batch:
+        transaction.on_commit(batch.flush)
+
+
+def is_pending_on_commit(batch):
+    connection = transaction.get_connection()
+    return not batch.flushed and connection.in_atomic_block and any(
+        func == batch.flush for _, func in connection.run_on_commit
+    )
+
+
+class OrderEventBatch:
+    def __init__(self):
+        self.kinds = {}
+        self.flushed = False
+
+    def flush(self):
+        self.flushed = True
+        if not self.kinds:
+            return
+        pending_kinds, self.kinds = self.kinds, {}
+
+        orders = Order.objects.select_related('restaurant').in_bulk(list(pending_kinds))
+        feed = get_order_feed()
+        for order_id, kinds in pending_kinds.items():
+            order = orders.get(order_id)
+            if order is None:
+                # Заказ создан и удалён в одной транзакции: на странице его
+                # не было, сообщать не о чем.
+                if 'added' in kinds:
+                    continue
+                kinds = ['deleted']
+            elif 'added' in kinds:
+                kinds = ['added']
+            for kind in kinds:
+                feed.publish(kind, order_id, get_event_data(kind, order))
@@ -0,0 +1,29 @@
+from functools import lru_cache
+
+import phonenumbers
+
+
+PHONE_REGION = 'RU'
+PARSE_CACHE_SIZE = 10000
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_phonenumber(phonenumber):
+    # Разбор номера по метаданным libphonenumber заметно дороже остальной
+    # проверки заказа, а постоянные клиенты присылают одни и те же номера.
+    # Возвращает (номер в E.164, ошибка): ошибка 'format', если строку не
+    # удалось разобрать, и 'invalid', если такого номера не бывает.
+    try:
+        parsed = phonenumbers.parse(phonenumber, PHONE_REGION)
+    except phonenumbers.NumberParseException:
+        return None, 'format'
+    if not phonenumbers.is_valid_number(parsed):
+        return None, 'invalid'
+    return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164), None
+
+
+def normalize_phonenumber(phonenumber):
+    if not phonenumber:
+        return ''
+    e164, _ = parse_phonenumber(str(phonenumber))
+    return e164 or ''
@@ -0,0 +1,69 @@
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from geodata.spatial import SpatialIndex
+
+from .models import Restaurant
+
+
+RESTAURANT_INDEX_VERSION_KEY = 'foodcartapp:restaurant-index-version'
+
+_lock = threading.Lock()
+_index = None
+_index_version = None
+
+
+def build_restaurant_index():
+    restaurants = Restaurant.objects.filter(
+        latitude__isnull=False,
+        longitude__isnull=False,
+    ).values_list('id', 'latitude', 'longitude')
+    return SpatialIndex(
+        (restaurant_id, float(latitude), float(longitude))
+        for restaurant_id, latitude, longitude in restaurants
+    )
+
+
+def get_restaurant_index():
+    global _index, _index_version
+
+    cache.add(RESTAURANT_INDEX_VERSION_KEY, 0, timeout=None)
+    version = cache.get(RESTAURANT_INDEX_VERSION_KEY)
+    with _lock:
+        if _index is None or _index_version != version:
+            _index = build_restaurant_index()
+            _index_version = version
+        return _index
+
+
+def bump_restaurant_index_version():
+    cache.add(RESTAURANT_INDEX_VERSION_KEY, 0, timeout=None)
+    cache.incr(RESTAURANT_INDEX_VERSION_KEY)
+
+
+def invalidate_restaurant_index(**kwargs):
+    # Внутри транзакции версия меняется дважды. Сразу — чтобы отложенный
+    # пересчёт кандидатов, запланированный в этой транзакции раньше сброса,
+    # не взял старый индекс. После коммита — чтобы процессы, успевшие за это
+    # время перестроить индекс по старым данным, перестроили его снова.
+    if connection.in_atomic_block:
+        bump_restaurant_index_version()
+    transaction.on_commit(bump_restaurant_index_version)
+
+
+def find_nearest_restaurants(coords, restaurant_ids, k=None, radius_km=None, index=None):
+    if not restaurant_ids:
+        return []
+    if index is None:
+        index = get_restaurant_index()
+    candidates = set(restaurant_ids)
+    nearest = index.nearest(
+        *coords,
+        k=k or settings.NEAREST_RESTAURANTS_LIMIT,
+        radius_km=radius_km if radius_km is not None else settings.DELIVERY_RADIUS_KM,
+        predicate=candidates.__contains__,
+    )
+    return nearest
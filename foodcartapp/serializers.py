@@ -1,10 +1,13 @@
-import phonenumbers
-
 from django.core.exceptions import ValidationError
-from geodata.utils import get_or_create_location
+from django.db import connection
+from geodata.addresses import normalize_address
+from geodata.utils import enqueue_geocoding
 from rest_framework import serializers
 
+from .candidates import schedule_candidates_refresh
 from .models import Order, OrderItem, Product
+from .order_feed import schedule_order_event
+from .phones import normalize_phonenumber, parse_phonenumber
 
 
 class PhoneNumberField(serializers.CharField):
@@ -12,21 +15,49 @@ class PhoneNumberField(serializers.CharField):
         if phonenumber == '':
             raise ValidationError('phonenumber: Это поле не может быть пустым.')
 
-        try:
-            parsed = phonenumbers.parse(phonenumber, 'RU')
-            if not phonenumbers.is_valid_number(parsed):
-                raise ValidationError('phonenumber: Введен некорректный номер телефона.')
-        except phonenumbers.NumberParseException:
+        _, error = parse_phonenumber(str(phonenumber))
+        if error == 'format':
             raise ValidationError('phonenumber: Неверный формат номера телефона.')
+        if error == 'invalid':
+            raise ValidationError('phonenumber: Введен некорректный номер телефона.')
         return phonenumber
 
 
+class CartProductField(serializers.PrimaryKeyRelatedField):
+    # Товары всей корзины OrderSerializer загружает одним запросом, поле
+    # только берёт нужный из готового словаря.
+    def to_internal_value(self, data):
+        products_by_id = getattr(self.root, 'products_by_id', None)
+        if products_by_id is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            product = products_by_id.get(int(data))
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if product is None:
+            self.fail('does_not_exist', pk_value=data)
+        return product
+
+
+class OrderItemListSerializer(serializers.ListSerializer):
+    # Только что созданный заказ несёт свои позиции в created_items, и ответ
+    # API собирается из них без повторного запроса.
+    def get_attribute(self, instance):
+        created_items = getattr(instance, 'created_items', None)
+        if created_items is not None:
+            return created_items
+        return super().get_attribute(instance)
+
+
 class OrderItemSerializer(serializers.ModelSerializer):
-    product = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all())
+    product = CartProductField(queryset=Product.objects.all())
 
     class Meta:
         model = OrderItem
         fields = ['product', 'quantity']
+        list_serializer_class = OrderItemListSerializer
 
 
 class OrderSerializer(serializers.ModelSerializer):
@@ -37,17 +68,77 @@ class OrderSerializer(serializers.ModelSerializer):
         model = Order
         fields = ['id', 'firstname', 'lastname', 'phonenumber', 'address', 'products']
 
+    def to_internal_value(self, data):
+        self.products_by_id = self.context.get('products_by_id')
+        if self.products_by_id is None:
+            self.products_by_id = Product.objects.in_bulk(get_cart_product_ids(data))
+        return super().to_internal_value(data)
+
     def create(self, validated_data):
-        items_data = validated_data.pop('items')
-        order = Order.objects.create(**validated_data)
+        return create_orders([validated_data])[0]
 
-        for item_data in items_data:
-            OrderItem.objects.create(
+
+def create_orders(orders_data):
+    orders = []
+    items = []
+    for order_data in orders_data:
+        order_data = dict(order_data)
+        items_data = order_data.pop('items')
+        order = Order(
+            **order_data,
+            normalized_address=normalize_address(order_data['address']),
+            phonenumber_e164=normalize_phonenumber(order_data['phonenumber']),
+            total_cost=sum(
+                item_data.get('price', item_data['product'].price) * item_data['quantity']
+                for item_data in items_data
+            ),
+        )
+        orders.append(order)
+        items.append([
+            OrderItem(
                 order=order,
                 product=item_data['product'],
                 quantity=item_data['quantity'],
-                price=item_data['product'].price
+                price=item_data.get('price', item_data['product'].price),
             )
+            for item_data in items_data
+        ])
+
+    if len(orders) > 1 and connection.features.can_return_rows_from_bulk_insert:
+        Order.objects.bulk_create(orders)
+    else:
+        for order in orders:
+            order.save()
+    OrderItem.objects.bulk_create([item for order_items in items for item in order_items])
+
+    # bulk_create не отправляет сигналы, поэтому пересчёт ресторанов и
+    # события для страницы менеджера запускаются здесь.
+    schedule_candidates_refresh([order.id for order in orders])
+    for order, order_items in zip(orders, items):
+        order.created_items = order_items
+        schedule_order_event(order.id, 'added')
+    for address in {order.address for order in orders}:
+        enqueue_geocoding(address)
+    return orders
+
 
-        get_or_create_location(validated_data['address'])
-        return order
\ No newline at end of file
+def get_cart_product_ids(*orders_data):
+    product_ids = set()
+    for data in orders_data:
+        items = data.get('products') if isinstance(data, dict) else None
+        if isinstance(items, list):
+            product_ids.update(get_items_product_ids(items))
+    return list(product_ids)
+
+
+def get_items_product_ids(items):
+    product_ids = set()
+    for item in items:
+        product_id = item.get('product') if isinstance(item, dict) else None
+        if isinstance(product_id, bool):
+            continue
+        try:
+            product_ids.add(int(product_id))
+        except (TypeError, ValueError):
+            continue
+    return product_ids
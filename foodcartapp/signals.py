@@ -0,0 +1,271 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from geodata.models import Location
+from geodata.signals import location_moved
+from geodata.utils import enqueue_geocoding, find_location
+
+from .availability import availability_index
+from .candidates import (
+    get_open_order_ids,
+    get_restaurant_order_ids,
+    schedule_candidates_refresh,
+)
+from .catalog import invalidate_catalog_snapshot
+from .models import (
+    Order,
+    OrderCandidate,
+    OrderItem,
+    Product,
+    ProductCategory,
+    Restaurant,
+    RestaurantMenuItem,
+)
+from .order_feed import schedule_order_event
+from .restaurant_index import invalidate_restaurant_index
+
+
+@receiver(pre_save, sender=RestaurantMenuItem)
+def remember_menu_item_pair(sender, instance, **kwargs):
+    instance.previous_pair = None
+    instance.previous_availability = None
+    if instance.pk:
+        previous_state = (
+            RestaurantMenuItem.objects
+            .filter(pk=instance.pk)
+            .values_list('restaurant_id', 'product_id', 'availability')
+            .first()
+        )
+        if previous_state:
+            instance.previous_pair = previous_state[:2]
+            instance.previous_availability = previous_state[2]
+
+
+@receiver(post_save, sender=RestaurantMenuItem)
+def update_availability_on_save(sender, instance, **kwargs):
+    previous_pair = getattr(instance, 'previous_pair', None)
+    current_pair = (instance.restaurant_id, instance.product_id)
+
+    def update_index():
+        if previous_pair and previous_pair != current_pair:
+            availability_index.set_availability(*previous_pair, False)
+        availability_index.set_availability(*current_pair, instance.availability)
+
+    transaction.on_commit(update_index)
+
+
+@receiver(post_delete, sender=RestaurantMenuItem)
+def update_availability_on_delete(sender, instance, **kwargs):
+    transaction.on_commit(
+        lambda: availability_index.set_availability(
+            instance.restaurant_id,
+            instance.product_id,
+            False,
+        )
+    )
+
+
+@receiver(pre_save, sender=Restaurant)
+def remember_restaurant_address(sender, instance, **kwargs):
+    instance.previous_address = None
+    if instance.pk:
+        instance.previous_address = (
+            Restaurant.objects
+            .filter(pk=instance.pk)
+            .values_list('address', flat=True)
+            .first()
+        )
+
+
+@receiver(post_save, sender=Restaurant)
+def locate_restaurant(sender, instance, created, **kwargs):
+    if not created and instance.previous_address == instance.address:
+        return
+
+    location = find_location(instance.address) if instance.address else None
+    instance.location = location
+    if location is not None:
+        instance.latitude = location.latitude
+        instance.longitude = location.longitude
+    else:
+        instance.latitude = instance.longitude = None
+    Restaurant.objects.filter(pk=instance.pk).update(
+        location=location,
+        latitude=instance.latitude,
+        longitude=instance.longitude,
+    )
+
+    if instance.address and (location is None or location.needs_lookup()):
+        enqueue_geocoding(instance.address)
+
+
+@receiver(post_save, sender=Location)
+def copy_coordinates_to_restaurants(sender, instance, **kwargs):
+    if instance.latitude is None or instance.longitude is None:
+        return
+    moved_restaurant_ids = list(
+        Restaurant.objects
+        .filter(normalized_address=instance.normalized_address)
+        .exclude(
+            location=instance,
+            latitude=instance.latitude,
+            longitude=instance.longitude,
+        )
+        .values_list('id', flat=True)
+    )
+    if not moved_restaurant_ids:
+        return
+    Restaurant.objects.filter(pk__in=moved_restaurant_ids).update(
+        location=instance,
+        latitude=instance.latitude,
+        longitude=instance.longitude,
+    )
+    # update() не отправляет сигналов Restaurant. Индекс сбрасывается до
+    # того, как запланирован пересчёт, иначе кандидаты посчитаются по
+    # старым координатам ресторанов.
+    invalidate_restaurant_index()
+    schedule_candidates_refresh(get_restaurant_order_ids(moved_restaurant_ids))
+
+
+for model in (Product, ProductCategory, RestaurantMenuItem):
+    post_save.connect(
+        invalidate_catalog_snapshot,
+        sender=model,
+        dispatch_uid=f'invalidate_catalog_on_{model.__name__}_save',
+    )
+    post_delete.connect(
+        invalidate_catalog_snapshot,
+        sender=model,
+        dispatch_uid=f'invalidate_catalog_on_{model.__name__}_delete',
+    )
+
+
+for model in (Restaurant, Location):
+    post_save.connect(
+        invalidate_restaurant_index,
+        sender=model,
+        dispatch_uid=f'invalidate_restaurant_index_on_{model.__name__}_save',
+    )
+    post_delete.connect(
+        invalidate_restaurant_index,
+        sender=model,
+        dispatch_uid=f'invalidate_restaurant_index_on_{model.__name__}_delete',
+    )
+
+
+# Обработчики ниже подключены после сброса индексов. Пересчёт кандидатов
+# не зависит от этого порядка: индекс ресторанов сбрасывается сразу, а не
+# только после коммита (см. invalidate_restaurant_index).
+
+@receiver(pre_save, sender=Order)
+def remember_order_state(sender, instance, **kwargs):
+    instance.previous_state = None
+    if instance.pk:
+        instance.previous_state = (
+            Order.objects
+            .filter(pk=instance.pk)
+            .values_list('address', 'status', 'restaurant_id')
+            .first()
+        )
+
+
+@receiver(post_save, sender=Order)
+def refresh_candidates_for_order(sender, instance, created, **kwargs):
+    if instance.status == 'completed':
+        OrderCandidate.objects.filter(order=instance).delete()
+        return
+    previous_state = getattr(instance, 'previous_state', None)
+    if created or previous_state is None:
+        return
+    previous_address, previous_status, _ = previous_state
+    if previous_address != instance.address or previous_status == 'completed':
+        schedule_candidates_refresh([instance.pk])
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def refresh_candidates_for_order_item(sender, instance, **kwargs):
+    schedule_candidates_refresh([instance.order_id])
+
+
+@receiver(post_save, sender=RestaurantMenuItem)
+def refresh_candidates_for_menu_item(sender, instance, **kwargs):
+    previous_pair = getattr(instance, 'previous_pair', None)
+    current_pair = (instance.restaurant_id, instance.product_id)
+    product_ids = set()
+    if previous_pair != current_pair:
+        product_ids.add(instance.product_id)
+        if previous_pair:
+            product_ids.add(previous_pair[1])
+    elif instance.previous_availability != instance.availability:
+        product_ids.add(instance.product_id)
+    if product_ids:
+        schedule_candidates_refresh(
+            get_open_order_ids().filter(items__product_id__in=product_ids).distinct()
+        )
+
+
+@receiver(post_delete, sender=RestaurantMenuItem)
+def refresh_candidates_for_deleted_menu_item(sender, instance, **kwargs):
+    if instance.availability:
+        schedule_candidates_refresh(
+            get_open_order_ids().filter(items__product_id=instance.product_id).distinct()
+        )
+
+
+@receiver(post_save, sender=Restaurant)
+def refresh_candidates_for_restaurant(sender, instance, created, **kwargs):
+    if not created and instance.previous_address != instance.address:
+        schedule_candidates_refresh(get_restaurant_order_ids([instance.pk]))
+
+
+@receiver(pre_delete, sender=Restaurant)
+def remember_restaurant_orders(sender, instance, **kwargs):
+    # Строки кандидатов удалятся каскадом раньше post_delete, а заказам, где
+    # был ресторан, нужно добрать следующего по расстоянию.
+    instance.candidate_order_ids = list(
+        OrderCandidate.objects
+        .filter(restaurant=instance)
+        .values_list('order_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Restaurant)
+def refresh_candidates_for_deleted_restaurant(sender, instance, **kwargs):
+    schedule_candidates_refresh(getattr(instance, 'candidate_order_ids', []))
+
+
+@receiver(location_moved)
+def refresh_candidates_for_location(sender, instance, **kwargs):
+    # Переехавшие рестораны пересчитывает copy_coordinates_to_restaurants:
+    # этот сигнал приходит раньше, чем ресторан привязан к адресу.
+    schedule_candidates_refresh(
+        get_open_order_ids().filter(normalized_address=instance.normalized_address)
+    )
+
+
+@receiver(post_save, sender=Order)
+def publish_order_changes(sender, instance, created, **kwargs):
+    if created:
+        schedule_order_event(instance.pk, 'added')
+        return
+    previous_state = getattr(instance, 'previous_state', None)
+    if previous_state is None:
+        return
+    _, previous_status, previous_restaurant_id = previous_state
+    if previous_status != instance.status:
+        schedule_order_event(instance.pk, 'status_changed')
+    if previous_restaurant_id != instance.restaurant_id:
+        schedule_order_event(instance.pk, 'restaurant_assigned')
+
+
+@receiver(post_delete, sender=Order)
+def publish_order_deletion(sender, instance, **kwargs):
+    schedule_order_event(instance.pk, 'deleted')
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def publish_order_items_changes(sender, instance, **kwargs):
+    schedule_order_event(instance.order_id, 'items_changed')
@@ -0,0 +1,768 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from math import inf
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from geodata.models import Location
+from geodata.utils import process_geocoding_jobs
+
+from .availability import AvailabilityIndex, availability_index
+from .candidates import schedule_candidates_refresh
+from .catalog import build_catalog_snapshot, bump_catalog_version, get_catalog_snapshot
+from .dispatch import apply_dispatch, greedy_assignment, plan_dispatch
+from .journal import (
+    OFFSET_SUFFIX,
+    REJECTED_NAME,
+    OrderJournal,
+    build_journal_entry,
+    drain_order_journal,
+    iter_segments,
+    load_offset,
+    make_intake_id,
+)
+from .models import (
+    IdempotencyKey,
+    Order,
+    OrderCandidate,
+    OrderItem,
+    Product,
+    ProductCategory,
+    Restaurant,
+    RestaurantMenuItem,
+)
+from .order_feed import get_feed, get_order_feed
+from .restaurant_index import bump_restaurant_index_version
+from .serializers import OrderSerializer
+from .signals import copy_coordinates_to_restaurants
+
+
+def create_product(name='Бургер', price=100):
+    category, _ = ProductCategory.objects.get_or_create(name='Бургеры')
+    return Product.objects.create(name=name, category=category, price=price, image='burger.jpg')
+
+
+def get_order_payload(product, quantity=1):
+    return {
+        'firstname': 'Иван',
+        'lastname': 'Петров',
+        'phonenumber': '+79161234567',
+        'address': 'Москва, Тверская улица, 1',
+        'products': [{'product': product.pk, 'quantity': quantity}],
+    }
+
+
+class OrderCandidatesTest(TransactionTestCase):
+    def setUp(self):
+        # Индексы живут в памяти процесса, а откаты других тестов не меняют
+        # их версий.
+        availability_index.invalidate()
+        bump_restaurant_index_version()
+
+    def test_geocoded_restaurant_gets_distance(self):
+        product = create_product()
+        Location.objects.create(
+            address='Москва, Тверская улица, 1',
+            latitude='55.76',
+            longitude='37.61',
+            lookup_status='found',
+        )
+        order = Order.objects.create(
+            firstname='Иван',
+            lastname='Петров',
+            phonenumber='+79161234567',
+            address='Москва, Тверская улица, 1',
+        )
+        OrderItem.objects.create(order=order, product=product, quantity=1, price=100)
+        restaurant = Restaurant.objects.create(
+            name='Star Burger',
+            address='Москва, Ленинский проспект, 1',
+        )
+        RestaurantMenuItem.objects.create(restaurant=restaurant, product=product)
+
+        with mock.patch('geodata.utils.fetch_coordinates', return_value=('55.70', '37.58')):
+            process_geocoding_jobs()
+
+        candidate = OrderCandidate.objects.get(order=order, restaurant=restaurant)
+        self.assertIsNotNone(candidate.distance)
+
+    def test_restaurant_changes_refresh_only_its_orders(self):
+        burger = create_product()
+        fries = create_product(name='Картошка')
+        restaurant = Restaurant.objects.create(name='Star Burger', address='Москва, Ленинский проспект, 1')
+        RestaurantMenuItem.objects.create(restaurant=restaurant, product=burger)
+        orders = []
+        for products in ([burger], [fries], [burger, fries]):
+            order = Order.objects.create(
+                firstname='Иван',
+                lastname='Петров',
+                phonenumber='+79161234567',
+                address='Москва, Тверская улица, 1',
+            )
+            for product in products:
+                OrderItem.objects.create(order=order, product=product, quantity=1, price=100)
+            orders.append(order)
+        self.assertEqual(
+            list(OrderCandidate.objects.values_list('order_id', 'restaurant_id')),
+            [(orders[0].pk, restaurant.pk)],
+        )
+
+        with mock.patch('foodcartapp.candidates.refresh_order_candidates') as refresh:
+            restaurant.address = 'Москва, Арбат, 1'
+            restaurant.save()
+        refresh.assert_called_once_with({orders[0].pk})
+
+        # Удалённые вместе с рестораном пункты меню добавляют заказы со своими
+        # товарами, но заказов с чужими товарами пересчёт не касается.
+        with mock.patch('foodcartapp.candidates.refresh_order_candidates') as refresh:
+            restaurant.delete()
+        refresh.assert_called_once()
+        self.assertIn(orders[0].pk, refresh.call_args.args[0])
+        self.assertNotIn(orders[1].pk, refresh.call_args.args[0])
+
+    def test_refresh_is_batched_until_commit(self):
+        with mock.patch('foodcartapp.candidates.refresh_order_candidates') as refresh:
+            with transaction.atomic():
+                schedule_candidates_refresh([1, 2])
+                schedule_candidates_refresh([2, 3])
+                refresh.assert_not_called()
+
+        refresh.assert_called_once_with({1, 2, 3})
+
+    def test_rolled_back_refresh_is_dropped(self):
+        with mock.patch('foodcartapp.candidates.refresh_order_candidates') as refresh:
+            with transaction.atomic():
+                schedule_candidates_refresh([1])
+                transaction.set_rollback(True)
+            with transaction.atomic():
+                schedule_candidates_refresh([2])
+
+        refresh.assert_called_once_with({2})
+
+
+class RestaurantCoordinatesTest(TestCase):
+    def test_coordinates_are_copied_by_normalized_address(self):
+        restaurant = Restaurant.objects.create(name='Star Burger', address='Москва, Ленинский пр-т, 1')
+        other_restaurant = Restaurant.objects.create(name='Star Burger Арбат', address='Москва, Арбат, 1')
+        location = Location.objects.create(
+            address='Москва, Ленинский проспект, 1',
+            latitude='55.70',
+            longitude='37.58',
+            lookup_status='found',
+        )
+
+        restaurant.refresh_from_db()
+        other_restaurant.refresh_from_db()
+        self.assertEqual(restaurant.location, location)
+        self.assertEqual(restaurant.latitude, Decimal('55.70'))
+        self.assertIsNone(other_restaurant.location)
+        self.assertIsNone(other_restaurant.latitude)
+
+        with self.assertNumQueries(1):
+            copy_coordinates_to_restaurants(sender=Location, instance=location)
+
+
+class GreedyAssignmentTest(SimpleTestCase):
+    def test_orders_go_to_nearest_restaurant(self):
+        distances = [
+            [1.0, 5.0],
+            [4.0, 2.0],
+        ]
+        self.assertEqual(list(greedy_assignment(distances, [inf, inf])), [0, 1])
+
+    def test_full_restaurant_gives_farther_orders_to_the_next(self):
+        distances = [
+            [3.0, 9.0],
+            [1.0, 8.0],
+            [2.0, 7.0],
+        ]
+        self.assertEqual(list(greedy_assignment(distances, [1, 5])), [1, 0, 1])
+
+    def test_capacity_is_shared_across_rounds(self):
+        distances = [
+            [1.0, 2.0, 9.0],
+            [1.5, 2.5, 9.0],
+            [1.2, 2.1, 9.0],
+            [1.1, 1.9, 3.0],
+        ]
+        assignment = list(greedy_assignment(distances, [1, 2, 1]))
+        self.assertEqual(assignment, [0, 2, 1, 1])
+
+    def test_unreachable_orders_stay_unassigned(self):
+        distances = [
+            [inf, inf],
+            [1.0, inf],
+            [2.0, inf],
+        ]
+        self.assertEqual(list(greedy_assignment(distances, [1, 3])), [-1, 0, -1])
+
+    def test_restaurant_without_free_places_is_skipped(self):
+        distances = [[1.0, 4.0]]
+        self.assertEqual(list(greedy_assignment(distances, [0, 1])), [1])
+        self.assertEqual(list(greedy_assignment(distances, [0, 0])), [-1])
+
+
+class DispatchTest(TestCase):
+    def create_order(self, product, restaurant=None):
+        order = Order.objects.create(
+            firstname='Иван',
+            lastname='Петров',
+            phonenumber='+79161234567',
+            address='Москва, Тверская улица, 1',
+            restaurant=restaurant,
+        )
+        OrderItem.objects.create(order=order, product=product, quantity=1, price=100)
+        return order
+
+    def test_busy_restaurant_hands_order_to_the_next(self):
+        product = create_product()
+        for address, latitude, longitude in [
+            ('Москва, Тверская улица, 1', '55.76', '37.61'),
+            ('Москва, Тверская улица, 3', '55.761', '37.611'),
+            ('Москва, Ленинский проспект, 1', '55.70', '37.58'),
+        ]:
+            Location.objects.create(
+                address=address,
+                latitude=latitude,
+                longitude=longitude,
+                lookup_status='found',
+            )
+        near = Restaurant.objects.create(name='Рядом', address='Москва, Тверская улица, 3', capacity=1)
+        far = Restaurant.objects.create(name='Далеко', address='Москва, Ленинский проспект, 1')
+        for restaurant in (near, far):
+            RestaurantMenuItem.objects.create(restaurant=restaurant, product=product)
+        availability_index.invalidate()
+        self.create_order(product, restaurant=near)
+        order = self.create_order(product)
+
+        plan = plan_dispatch()
+        self.assertEqual(
+            [(planned_order, restaurant) for planned_order, restaurant, _ in plan.assignments],
+            [(order, far)],
+        )
+        self.assertEqual(plan.unassigned, [])
+
+        self.assertEqual(apply_dispatch(plan), [order])
+        order.refresh_from_db()
+        self.assertEqual(order.restaurant, far)
+        self.assertEqual(apply_dispatch(plan), [])
+
+
+class OrderSerializerTest(TestCase):
+    def test_created_order_is_serialized_without_queries(self):
+        products = [create_product(name=f'Бургер {number}') for number in range(3)]
+        payload = get_order_payload(products[0])
+        payload['products'] = [{'product': product.pk, 'quantity': 2} for product in products]
+        serializer = OrderSerializer(data=payload)
+        serializer.is_valid(raise_exception=True)
+        order = serializer.save()
+
+        with self.assertNumQueries(0):
+            data = OrderSerializer(order).data
+        self.assertEqual(
+            data['products'],
+            [{'product': product.pk, 'quantity': 2} for product in products],
+        )
+
+    def test_stored_order_reads_items_from_db(self):
+        product = create_product()
+        order = Order.objects.create(
+            firstname='Иван',
+            lastname='Петров',
+            phonenumber='+79161234567',
+            address='Москва, Тверская улица, 1',
+        )
+        OrderItem.objects.create(order=order, product=product, quantity=3, price=100)
+
+        data = OrderSerializer(Order.objects.get(pk=order.pk)).data
+        self.assertEqual(data['products'], [{'product': product.pk, 'quantity': 3}])
+
+
+class OrderBatchTest(TestCase):
+    def setUp(self):
+        self.product = create_product()
+
+    def post_batch(self, orders_data):
+        return self.client.post('/api/orders/batch/', orders_data, content_type='application/json')
+
+    def test_valid_batch_is_created(self):
+        response = self.post_batch([get_order_payload(self.product), get_order_payload(self.product, quantity=2)])
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 2)
+        self.assertEqual(
+            [result['status'] for result in response.json()['results']],
+            ['created', 'created'],
+        )
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(OrderItem.objects.count(), 2)
+
+    def test_partial_failure_is_multi_status(self):
+        invalid_order = get_order_payload(self.product)
+        invalid_order['products'] = [{'product': self.product.pk + 100, 'quantity': 1}]
+
+        response = self.post_batch([get_order_payload(self.product), invalid_order])
+
+        self.assertEqual(response.status_code, 207)
+        first, second = response.json()['results']
+        self.assertEqual(first['status'], 'created')
+        self.assertEqual(first['order']['id'], Order.objects.get().pk)
+        self.assertEqual(second['index'], 1)
+        self.assertEqual(second['status'], 'invalid')
+        self.assertIn('products', second['errors'])
+
+    def test_batch_without_valid_orders_is_rejected(self):
+        invalid_order = get_order_payload(self.product)
+        invalid_order['phonenumber'] = '123'
+
+        response = self.post_batch([invalid_order])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['created'], 0)
+        self.assertFalse(Order.objects.exists())
+
+    @override_settings(ORDER_BATCH_MAX_SIZE=2)
+    def test_malformed_batches_are_rejected(self):
+        for orders_data in [{}, [], [get_order_payload(self.product)] * 3]:
+            with self.subTest(orders_data=orders_data):
+                response = self.post_batch(orders_data)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+        self.assertFalse(Order.objects.exists())
+
+    def test_failed_insert_rolls_back_the_batch(self):
+        with mock.patch('foodcartapp.serializers.OrderItem.objects.bulk_create', side_effect=ValueError('bulk')):
+            response = self.post_batch([get_order_payload(self.product)] * 2)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+
+class PhoneNumberLookupTest(TestCase):
+    def create_order(self, phonenumber, firstname='Иван'):
+        return Order.objects.create(
+            firstname=firstname,
+            lastname='Петров',
+            phonenumber=phonenumber,
+            address='Москва, Тверская улица, 1',
+        )
+
+    def test_any_spelling_finds_the_customer(self):
+        orders = [self.create_order('+79161234567'), self.create_order('8 (916) 123-45-67')]
+        self.create_order('+79167654321')
+
+        for phonenumber in ['+7 916 123-45-67', '89161234567', '8 (916) 123 45 67']:
+            with self.subTest(phonenumber):
+                self.assertCountEqual(Order.objects.by_phonenumber(phonenumber), orders)
+        self.assertEqual(orders[1].phonenumber_e164, '+79161234567')
+
+    def test_invalid_phone_finds_nothing(self):
+        self.create_order('+79161234567')
+        for phonenumber in ['', 'телефон', '123']:
+            with self.subTest(phonenumber):
+                self.assertFalse(Order.objects.by_phonenumber(phonenumber).exists())
+
+    def test_api_order_gets_e164_phone(self):
+        product = create_product()
+        payload = get_order_payload(product)
+        payload['phonenumber'] = '8 (916) 123-45-67'
+        response = self.client.post('/api/order/', payload, content_type='application/json')
+
+        self.assertEqual(Order.objects.get(pk=response.json()['id']).phonenumber_e164, '+79161234567')
+
+    def test_admin_search_by_phone_and_name(self):
+        manager = User.objects.create_superuser('manager', 'manager@example.com', 'password')
+        self.client.force_login(manager)
+        order = self.create_order('+79161234567')
+        other_order = self.create_order('+79167654321', firstname='Пётр')
+
+        for search_term, expected in [('8 (916) 123-45-67', [order]), ('Пётр', [other_order])]:
+            with self.subTest(search_term):
+                response = self.client.get('/admin/foodcartapp/order/', {'q': search_term})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(list(response.context['cl'].result_list), expected)
+
+
+class OrderJournalTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.product = create_product()
+
+    def make_entry(self, product=None, quantity=1):
+        validated_data = {
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79161234567',
+            'address': 'Москва, Тверская улица, 1',
+            'items': [{'product': product or self.product, 'quantity': quantity}],
+        }
+        return build_journal_entry(make_intake_id(), validated_data)
+
+    def open_journal(self, **kwargs):
+        journal = OrderJournal(self.directory, **kwargs)
+        self.addCleanup(journal.close)
+        return journal
+
+    def write_orders(self, count):
+        journal = self.open_journal()
+        for _ in range(count):
+            journal.append(self.make_entry())
+        return journal
+
+    def test_group_commit_syncs_concurrent_appends_together(self):
+        journal = self.open_journal(group_commit_delay=0.05)
+        threads = [
+            threading.Thread(target=journal.append, args=[self.make_entry()])
+            for _ in range(10)
+        ]
+        with mock.patch('os.fsync', wraps=os.fsync) as fsync:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        with open(journal.path) as segment_file:
+            self.assertEqual(len(segment_file.readlines()), 10)
+        self.assertLess(fsync.call_count, 10)
+
+    def test_drain_saves_orders_and_offset(self):
+        journal = self.write_orders(3)
+
+        orders, rejected = drain_order_journal(self.directory)
+
+        self.assertEqual((len(orders), rejected), (3, 0))
+        self.assertEqual(load_offset(journal.path), os.path.getsize(journal.path))
+        self.assertEqual(Order.objects.filter(intake_id__isnull=False).count(), 3)
+        self.assertEqual(drain_order_journal(self.directory), ([], 0))
+
+    def test_price_is_taken_at_intake(self):
+        self.write_orders(1)
+        Product.objects.filter(pk=self.product.pk).update(price=500)
+
+        orders, _ = drain_order_journal(self.directory)
+
+        self.assertEqual(orders[0].total_cost, 100)
+        self.assertEqual(orders[0].items.get().price, 100)
+
+    def test_replay_after_crash_before_checkpoint(self):
+        journal = self.write_orders(2)
+        with mock.patch('foodcartapp.journal.save_offset', side_effect=OSError):
+            with self.assertRaises(OSError):
+                drain_order_journal(self.directory)
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(load_offset(journal.path), 0)
+
+        self.assertEqual(drain_order_journal(self.directory), ([], 0))
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(load_offset(journal.path), os.path.getsize(journal.path))
+
+    def test_partial_trailing_line_waits_for_next_pass(self):
+        journal = self.write_orders(1)
+        complete_size = os.path.getsize(journal.path)
+        entry = self.make_entry()
+        with open(journal.path, 'a') as segment_file:
+            segment_file.write(f'{{"intake_id": "{entry["intake_id"]}", ')
+
+        orders, _ = drain_order_journal(self.directory)
+        self.assertEqual(len(orders), 1)
+        self.assertEqual(load_offset(journal.path), complete_size)
+
+        with open(journal.path, 'a') as segment_file:
+            segment_file.write('"broken": true}\n')
+        orders, rejected = drain_order_journal(self.directory)
+        self.assertEqual((len(orders), rejected), (0, 1))
+
+    def test_unusable_entries_go_to_rejected(self):
+        journal = self.open_journal()
+        journal.append(self.make_entry(product=create_product('Исчезнувший бургер')))
+        journal.append(self.make_entry())
+        with open(journal.path, 'a') as segment_file:
+            segment_file.write('not json\n')
+        Product.objects.filter(name='Исчезнувший бургер').delete()
+
+        orders, rejected = drain_order_journal(self.directory)
+
+        self.assertEqual((len(orders), rejected), (1, 2))
+        with open(os.path.join(self.directory, REJECTED_NAME)) as rejected_file:
+            self.assertEqual(len(rejected_file.readlines()), 2)
+
+    def test_only_abandoned_segments_are_removed(self):
+        live_journal = self.write_orders(1)
+        closed_journal = self.write_orders(1)
+        closed_journal.close()
+
+        drain_order_journal(self.directory)
+
+        self.assertEqual(iter_segments(self.directory), [live_journal.path])
+        self.assertFalse(os.path.exists(closed_journal.path + OFFSET_SUFFIX))
+
+    def test_journaled_order_is_accepted_once_per_idempotency_key(self):
+        client = APIClient()
+        with override_settings(ORDER_INTAKE_JOURNAL=True, ORDER_JOURNAL_DIR=self.directory):
+            responses = [
+                client.post(
+                    '/api/order/',
+                    get_order_payload(self.product),
+                    format='json',
+                    HTTP_IDEMPOTENCY_KEY='journal-key',
+                )
+                for _ in range(2)
+            ]
+
+        self.assertEqual([response.status_code for response in responses], [202, 202])
+        self.assertEqual(responses[0].data['intake_id'], responses[1].data['intake_id'])
+        orders, _ = drain_order_journal(self.directory)
+        self.assertEqual(len(orders), 1)
+
+
+class CatalogSnapshotTest(TestCase):
+    def test_not_modified_response_keeps_etag(self):
+        etag = self.client.get('/api/products/')['ETag']
+
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_snapshot_built_during_invalidation_is_not_reused(self):
+        def build_and_invalidate():
+            snapshot = build_catalog_snapshot()
+            bump_catalog_version()
+            return snapshot
+
+        bump_catalog_version()
+        with mock.patch('foodcartapp.catalog.build_catalog_snapshot', side_effect=build_and_invalidate):
+            get_catalog_snapshot()
+
+        with mock.patch('foodcartapp.catalog.build_catalog_snapshot', wraps=build_catalog_snapshot) as build:
+            get_catalog_snapshot()
+            get_catalog_snapshot()
+        self.assertEqual(build.call_count, 1)
+
+
+class AvailabilityIndexTest(TestCase):
+    def test_concurrent_change_forces_rebuild(self):
+        product = create_product()
+        restaurants = [
+            Restaurant.objects.create(name=f'Star Burger {number}') for number in range(2)
+        ]
+        index = AvailabilityIndex()
+        self.assertEqual(index.restaurants_for([product.pk]), [])
+
+        # Другой процесс включает товар в первом ресторане между проверкой
+        # версии и её увеличением в этом процессе.
+        RestaurantMenuItem.objects.create(restaurant=restaurants[0], product=product)
+        get_version = index._get_version
+
+        def get_version_then_bump():
+            version = get_version()
+            index._bump_version()
+            return version
+
+        with mock.patch.object(index, '_get_version', side_effect=get_version_then_bump):
+            index.set_availability(restaurants[1].pk, product.pk, True)
+        RestaurantMenuItem.objects.create(restaurant=restaurants[1], product=product)
+
+        self.assertCountEqual(
+            index.restaurants_for([product.pk]),
+            [restaurant.pk for restaurant in restaurants],
+        )
+
+
+    def test_many_available_products_use_subquery(self):
+        restaurant = Restaurant.objects.create(name='Star Burger')
+        products = [create_product(name=f'Бургер {number}') for number in range(3)]
+        for product in products[:2]:
+            RestaurantMenuItem.objects.create(restaurant=restaurant, product=product)
+        RestaurantMenuItem.objects.create(restaurant=restaurant, product=products[2], availability=False)
+        availability_index.invalidate()
+
+        with mock.patch('foodcartapp.models.AVAILABLE_IDS_LIMIT', 1):
+            queryset = Product.objects.available()
+            self.assertIn('foodcartapp_restaurantmenuitem', str(queryset.query))
+            self.assertCountEqual(queryset, products[:2])
+
+
+@override_settings(ORDER_FEED='foodcartapp.order_feed.MemoryOrderFeed')
+class OrderFeedTest(TestCase):
+    def setUp(self):
+        get_feed.cache_clear()
+        self.addCleanup(get_feed.cache_clear)
+        self.feed = get_order_feed()
+        self.product = create_product()
+
+    def create_order(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/order/',
+                get_order_payload(self.product, quantity=2),
+                content_type='application/json',
+            )
+        return Order.objects.get(pk=response.json()['id'])
+
+    def test_new_order_is_one_added_event(self):
+        order = self.create_order()
+
+        events = self.feed.read(0)
+        self.assertEqual([event['kind'] for event in events], ['added'])
+        self.assertEqual(events[0]['order_id'], order.pk)
+        self.assertEqual(events[0]['data']['firstname'], 'Иван')
+        self.assertEqual(events[0]['data']['total_cost'], '200.00')
+
+    def test_status_and_restaurant_changes(self):
+        order = self.create_order()
+        after = self.feed.last_id()
+        restaurant = Restaurant.objects.create(name='Star Burger')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order.status = 'assembly'
+            order.restaurant = restaurant
+            order.save()
+
+        events = {event['kind']: event['data'] for event in self.feed.read(after)}
+        self.assertEqual(
+            events,
+            {
+                'status_changed': {'status': 'assembly', 'status_display': 'Сборка'},
+                'restaurant_assigned': {'restaurant': 'Star Burger'},
+            },
+        )
+
+    def test_rolled_back_changes_are_not_published(self):
+        order = self.create_order()
+        after = self.feed.last_id()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                order.status = 'assembly'
+                order.save()
+                transaction.set_rollback(True)
+        self.assertEqual(self.feed.last_id(), after)
+
+        # Отменённые события не должны всплыть и при следующем коммите.
+        new_order = self.create_order()
+        self.assertEqual(
+            [(event['kind'], event['order_id']) for event in self.feed.read(after)],
+            [('added', new_order.pk)],
+        )
+
+    def test_stream_resumes_after_last_event_id(self):
+        first_order = self.create_order()
+        second_order = self.create_order()
+        manager = User.objects.create_user('manager', password='password', is_staff=True)
+        self.client.force_login(manager)
+
+        response = self.client.get(
+            '/manager/orders/events/?timeout=0',
+            HTTP_ACCEPT='text/event-stream',
+            HTTP_LAST_EVENT_ID=str(self.feed.read(0)[0]['id']),
+        )
+        body = b''.join(response.streaming_content).decode()
+
+        self.assertIn(f'"order_id": {second_order.pk}', body)
+        self.assertNotIn(f'"order_id": {first_order.pk}', body)
+
+    def test_long_poll_returns_events_after_id(self):
+        self.create_order()
+        manager = User.objects.create_user('manager', password='password', is_staff=True)
+        self.client.force_login(manager)
+
+        response = self.client.get('/manager/orders/events/?timeout=0&after=0')
+
+        data = json.loads(response.content)
+        self.assertEqual([event['kind'] for event in data['events']], ['added'])
+        self.assertEqual(data['last_id'], data['events'][-1]['id'])
+
+
+class IdempotencyKeyTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.product = create_product()
+
+    def post_order(self, payload, key='order-key'):
+        return self.client.post('/api/order/', payload, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_repeat_replays_first_response(self):
+        payload = get_order_payload(self.product)
+        first_response = self.post_order(payload)
+        second_response = self.post_order(payload)
+
+        self.assertEqual(first_response.status_code, 201)
+        self.assertEqual(second_response.status_code, 201)
+        self.assertEqual(second_response['Idempotent-Replayed'], 'true')
+        self.assertEqual(second_response.json(), first_response.json())
+        self.assertFalse(first_response.has_header('Idempotent-Replayed'))
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_repeat_through_url_alias_is_replayed(self):
+        payload = get_order_payload(self.product)
+        first_response = self.post_order(payload)
+        second_response = self.client.post(
+            '/api/api/order/',
+            payload,
+            format='json',
+            HTTP_IDEMPOTENCY_KEY='order-key',
+        )
+
+        self.assertEqual(second_response.status_code, 201)
+        self.assertEqual(second_response['Idempotent-Replayed'], 'true')
+        self.assertEqual(second_response.json(), first_response.json())
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_same_key_with_other_body_is_rejected(self):
+        self.post_order(get_order_payload(self.product))
+
+        response = self.post_order(get_order_payload(self.product, quantity=2))
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_expired_key_is_claimed_again(self):
+        self.post_order(get_order_payload(self.product))
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+
+        response = self.post_order(get_order_payload(self.product, quantity=2))
+
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_invalid_order_releases_key(self):
+        payload = get_order_payload(self.product)
+        invalid_response = self.post_order({**payload, 'products': []})
+        self.assertEqual(invalid_response.status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        response = self.post_order(payload)
+
+        self.assertEqual(response.status_code, 201)
+
+    def test_too_long_key_is_rejected(self):
+        response = self.post_order(get_order_payload(self.product), key='k' * 256)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_prune_removes_only_expired_keys(self):
+        self.post_order(get_order_payload(self.product), key='old-key')
+        self.post_order(get_order_payload(self.product), key='new-key')
+        IdempotencyKey.objects.filter(key='old-key').update(
+            created_at=timezone.now() - timedelta(days=2)
+        )
+
+        call_command('prune_idempotency_keys', stdout=StringIO())
+
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['new-key'])
@@ -1,12 +1,29 @@
+from django.conf import settings
 from django.db import transaction
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.templatetags.static import static
+from django.utils.cache import get_conditional_response
 
+from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
+from .catalog import (
+    get_catalog_products,
+    get_catalog_snapshot,
+    get_json_dumps_params,
+    iter_catalog_chunks,
+)
+from .idempotency import (
+    IDEMPOTENCY_HEADER,
+    MAX_KEY_LENGTH,
+    claim_idempotency_key,
+    get_request_fingerprint,
+    remember_response,
+)
+from .journal import build_journal_entry, get_order_journal, make_intake_id
 from .models import Product
-from .serializers import OrderSerializer
+from .serializers import OrderSerializer, create_orders, get_cart_product_ids
 
 
 def banners_list_api(request):
@@ -27,50 +44,153 @@ def banners_list_api(request):
             'src': static('tasty.jpg'),
             'text': 'Food is incomplete without a tasty dessert',
         }
-    ], safe=False, json_dumps_params={
-        'ensure_ascii': False,
-        'indent': 4,
-    })
+    ], safe=False, json_dumps_params=get_json_dumps_params())
 
 
 def product_list_api(request):
-    products = Product.objects.select_related('category').available()
-
-    dumped_products = []
-    for product in products:
-        dumped_product = {
-            'id': product.id,
-            'name': product.name,
-            'price': product.price,
-            'special_status': product.special_status,
-            'description': product.description,
-            'category': {
-                'id': product.category.id,
-                'name': product.category.name,
-            } if product.category else None,
-            'image': product.image.url,
-            'restaurant': {
-                'id': product.id,
-                'name': product.name,
-            }
-        }
-        dumped_products.append(dumped_product)
-    return JsonResponse(dumped_products, safe=False, json_dumps_params={
-        'ensure_ascii': False,
-        'indent': 4,
-    })
+    if not settings.CATALOG_SNAPSHOT:
+        return StreamingHttpResponse(
+            iter_catalog_chunks(get_catalog_products()),
+            content_type='application/json',
+        )
+
+    snapshot = get_catalog_snapshot()
+    etag = f'"{snapshot.version}"'
+
+    response = HttpResponse(snapshot.body, content_type='application/json')
+    response['ETag'] = etag
+    return get_conditional_response(request, etag=etag, response=response)
 
 
 @api_view(['POST'])
-@transaction.atomic
 def register_order(request):
+    if settings.ORDER_INTAKE_JOURNAL:
+        return journal_order(request)
+    return save_order(request)
+
+
+def journal_order(request):
+    # Заказ проверяется как обычно, но в БД сразу не пишется: он попадает в
+    # журнал на диске, а в заказы его переносит команда drain_order_journal.
+    idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+    if idempotency_key and len(idempotency_key) > MAX_KEY_LENGTH:
+        return Response(
+            {'error': f'{IDEMPOTENCY_HEADER}: не длиннее {MAX_KEY_LENGTH} символов'},
+            status=400,
+        )
+
+    serializer = OrderSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+
+    entry = build_journal_entry(make_intake_id(idempotency_key), serializer.validated_data)
+    get_order_journal().append(entry)
+    return Response(
+        {
+            'intake_id': entry['intake_id'],
+            'firstname': entry['firstname'],
+            'lastname': entry['lastname'],
+            'phonenumber': entry['phonenumber'],
+            'address': entry['address'],
+            'products': [
+                {'product': item['product'], 'quantity': item['quantity']}
+                for item in entry['products']
+            ],
+        },
+        status=202,
+    )
+
+
+@transaction.atomic
+def save_order(request):
+    idempotency_record = None
+    idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+    if idempotency_key:
+        if len(idempotency_key) > MAX_KEY_LENGTH:
+            return Response(
+                {'error': f'{IDEMPOTENCY_HEADER}: не длиннее {MAX_KEY_LENGTH} символов'},
+                status=400,
+            )
+        fingerprint = get_request_fingerprint(request)
+        idempotency_record, claimed = claim_idempotency_key(idempotency_key, fingerprint)
+        if not claimed:
+            return replay_response(idempotency_record, fingerprint)
+
     serializer = OrderSerializer(data=request.data)
     serializer.is_valid(raise_exception=True)
 
     try:
         order = serializer.save()
     except Exception as error:
+        transaction.set_rollback(True)
         return Response({'error': str(error)}, status=400)
 
     output_serializer = OrderSerializer(order)
-    return Response(output_serializer.data, status=201)
\ No newline at end of file
+    if idempotency_record:
+        remember_response(idempotency_record, 201, output_serializer.data)
+    return Response(output_serializer.data, status=201)
+
+
+def replay_response(record, fingerprint):
+    if record.fingerprint != fingerprint:
+        return Response(
+            {'error': f'{IDEMPOTENCY_HEADER} уже использован с другим запросом'},
+            status=422,
+        )
+    if record.status_code is None:
+        return Response(
+            {'error': f'Запрос с этим {IDEMPOTENCY_HEADER} ещё обрабатывается'},
+            status=409,
+        )
+    response = Response(record.response_body, status=record.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+@api_view(['POST'])
+@transaction.atomic
+def register_orders_batch(request):
+    orders_data = request.data
+    if not isinstance(orders_data, list) or not orders_data:
+        return Response({'error': 'Ожидается непустой список заказов'}, status=400)
+    if len(orders_data) > settings.ORDER_BATCH_MAX_SIZE:
+        return Response(
+            {'error': f'В пакете не больше {settings.ORDER_BATCH_MAX_SIZE} заказов'},
+            status=400,
+        )
+
+    products_by_id = Product.objects.in_bulk(get_cart_product_ids(*orders_data))
+    order_serializers = [
+        OrderSerializer(data=order_data, context={'products_by_id': products_by_id})
+        for order_data in orders_data
+    ]
+    valid_serializers = [
+        serializer for serializer in order_serializers if serializer.is_valid()
+    ]
+
+    orders = []
+    if valid_serializers:
+        try:
+            orders = create_orders([serializer.validated_data for serializer in valid_serializers])
+        except Exception as error:
+            transaction.set_rollback(True)
+            return Response({'error': str(error)}, status=400)
+    created_orders = dict(zip(valid_serializers, orders))
+
+    results = []
+    for index, serializer in enumerate(order_serializers):
+        if serializer in created_orders:
+            results.append({
+                'index': index,
+                'status': 'created',
+                'order': OrderSerializer(created_orders[serializer]).data,
+            })
+        else:
+            results.append({'index': index, 'status': 'invalid', 'errors': serializer.errors})
+
+    if not orders:
+        response_status = status.HTTP_400_BAD_REQUEST
+    elif len(orders) < len(order_serializers):
+        response_status = status.HTTP_207_MULTI_STATUS
+    else:
+        response_status = status.HTTP_201_CREATED
+    return Response({'created': len(orders), 'results': results}, status=response_status)
@@ -1,8 +1,23 @@
 from django.contrib import admin
-from .models import Location
+from .models import GeocodingJob, Location
 
 
 @admin.register(Location)
 class LocationAdmin(admin.ModelAdmin):
-    list_display = ('address', 'latitude', 'longitude', 'date_of_request')
-    search_fields = ('address',)
\ No newline at end of file
+    list_display = (
+        'address',
+        'normalized_address',
+        'latitude',
+        'longitude',
+        'lookup_status',
+        'date_of_request',
+    )
+    list_filter = ('lookup_status',)
+    search_fields = ('address', 'normalized_address')
+
+
+@admin.register(GeocodingJob)
+class GeocodingJobAdmin(admin.ModelAdmin):
+    list_display = ('address', 'status', 'attempts', 'next_attempt_at', 'last_error')
+    list_filter = ('status',)
+    search_fields = ('address',)
@@ -0,0 +1,187 @@
+import random
+import threading
+import time
+from collections import Counter
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class GeocoderUnavailable(requests.RequestException):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold, recovery_timeout):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_progress = False
+
+    @property
+    def retry_at(self):
+        if self._opened_at is None:
+            return None
+        return self._opened_at + self.recovery_timeout
+
+    def allow_request(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() < self.retry_at or self._trial_in_progress:
+                return False
+            self._trial_in_progress = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_progress or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_progress = False
+
+
+class RateLimiter:
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class GeocoderClient:
+    def __init__(
+        self,
+        base_url,
+        apikey,
+        connect_timeout=3.05,
+        read_timeout=5,
+        max_retries=2,
+        backoff=0.5,
+        failure_threshold=5,
+        recovery_timeout=30,
+        pool_size=10,
+    ):
+        self.base_url = base_url
+        self.apikey = apikey
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = CircuitBreaker(failure_threshold, recovery_timeout)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._stats_lock = threading.Lock()
+        self._counters = Counter()
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def fetch_coordinates(self, address):
+        if not self.breaker.allow_request():
+            self._count('short_circuited')
+            raise GeocoderUnavailable('Геокодер недоступен, повторите позже')
+
+        try:
+            response = self._get_with_retries(address)
+        except requests.RequestException:
+            self._count('failures')
+            self.breaker.record_failure()
+            raise
+        self._count('successes')
+        self.breaker.record_success()
+
+        found_places = response.json()['response']['GeoObjectCollection']['featureMember']
+        if not found_places:
+            return None, None
+
+        most_relevant = found_places[0]
+        lon, lat = most_relevant['GeoObject']['Point']['pos'].split(" ")
+        return lat, lon
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._counters)
+            requests_count = stats.get('requests', 0)
+            stats['latency_avg'] = self._latency_total / requests_count if requests_count else 0.0
+            stats['latency_max'] = self._latency_max
+        stats['circuit_open'] = self.breaker.retry_at is not None
+        return stats
+
+    def _get_with_retries(self, address):
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._count('retries')
+                time.sleep(self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+            try:
+                response = self._get(address)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                continue
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                continue
+            response.raise_for_status()
+            return response
+
+    def _get(self, address):
+        started_at = time.monotonic()
+        try:
+            return self.session.get(self.base_url, timeout=self.timeout, params={
+                "geocode": address,
+                "apikey": self.apikey,
+                "format": "json",
+            })
+        finally:
+            latency = time.monotonic() - started_at
+            with self._stats_lock:
+                self._counters['requests'] += 1
+                self._latency_total += latency
+                self._latency_max = max(self._latency_max, latency)
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._counters[name] += 1
+
+
+_yandex_client = None
+_yandex_client_lock = threading.Lock()
+
+
+def get_yandex_client():
+    global _yandex_client
+
+    with _yandex_client_lock:
+        if _yandex_client is None:
+            _yandex_client = GeocoderClient(
+                base_url=settings.YANDEX_GEOCODER_URL,
+                apikey=settings.YANDEX_APIKEY,
+                connect_timeout=settings.GEOCODER_CONNECT_TIMEOUT,
+                read_timeout=settings.GEOCODER_READ_TIMEOUT,
+                max_retries=settings.GEOCODER_MAX_RETRIES,
+                backoff=settings.GEOCODER_RETRY_BACKOFF,
+                failure_threshold=settings.GEOCODER_FAILURE_THRESHOLD,
+                recovery_timeout=settings.GEOCODER_RECOVERY_TIMEOUT,
+            )
+        return _yandex_client
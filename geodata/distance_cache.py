@@ -0,0 +1,139 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from .distances import haversine_matrix
+from .models import Distance, Location
+
+
+DISTANCE_CACHE_VERSION_KEY = 'geodata:distance-cache-version'
+
+
+class DistanceCache:
+    # Расстояния между парами Location: LRU в памяти процесса перед таблицей
+    # Distance. Когда у адреса меняются координаты, его строки удаляются из
+    # таблицы, а смена версии в общем кэше сбрасывает LRU во всех процессах.
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._version = None
+
+    def get_many(self, pairs):
+        pairs = set(pairs)
+        found = {}
+        with self._lock:
+            self._ensure_fresh()
+            for pair in pairs:
+                if pair in self._entries:
+                    self._entries.move_to_end(pair)
+                    found[pair] = self._entries[pair]
+
+        missing = pairs - found.keys()
+        if missing:
+            stored = self._load(missing)
+            missing -= stored.keys()
+            computed = self._compute(missing)
+            found.update(stored)
+            found.update(computed)
+            with self._lock:
+                for pair, km in {**stored, **computed}.items():
+                    self._remember(pair, km)
+        return found
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _ensure_fresh(self):
+        cache.add(DISTANCE_CACHE_VERSION_KEY, 0, timeout=None)
+        version = cache.get(DISTANCE_CACHE_VERSION_KEY)
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    def _remember(self, pair, km):
+        self._entries[pair] = km
+        self._entries.move_to_end(pair)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _load(self, pairs):
+        origin_ids = {origin_id for origin_id, _ in pairs}
+        destination_ids = {destination_id for _, destination_id in pairs}
+        rows = Distance.objects.filter(
+            origin_id__in=origin_ids,
+            destination_id__in=destination_ids,
+        ).values_list('origin_id', 'destination_id', 'km')
+        return {
+            (origin_id, destination_id): km
+            for origin_id, destination_id, km in rows
+            if (origin_id, destination_id) in pairs
+        }
+
+    def _compute(self, pairs):
+        if not pairs:
+            return {}
+        location_ids = {location_id for pair in pairs for location_id in pair}
+        coords = {
+            location_id: (float(latitude), float(longitude))
+            for location_id, latitude, longitude in Location.objects.filter(
+                pk__in=location_ids,
+                latitude__isnull=False,
+                longitude__isnull=False,
+            ).values_list('id', 'latitude', 'longitude')
+        }
+        pairs = [
+            (origin_id, destination_id)
+            for origin_id, destination_id in pairs
+            if origin_id in coords and destination_id in coords
+        ]
+        if not pairs:
+            return {}
+
+        # Все промахи считаются одной матрицей гаверсинусов: строки — адреса
+        # доставки, столбцы — рестораны, из неё берутся только нужные пары.
+        origin_ids = sorted({origin_id for origin_id, _ in pairs})
+        destination_ids = sorted({destination_id for _, destination_id in pairs})
+        matrix = haversine_matrix(
+            [coords[origin_id] for origin_id in origin_ids],
+            [coords[destination_id] for destination_id in destination_ids],
+        )
+        rows = {origin_id: row for row, origin_id in enumerate(origin_ids)}
+        columns = {destination_id: column for column, destination_id in enumerate(destination_ids)}
+        computed = {
+            (origin_id, destination_id): float(matrix[rows[origin_id], columns[destination_id]])
+            for origin_id, destination_id in pairs
+        }
+        Distance.objects.bulk_create(
+            [
+                Distance(origin_id=origin_id, destination_id=destination_id, km=km)
+                for (origin_id, destination_id), km in computed.items()
+            ],
+            ignore_conflicts=True,
+        )
+        return computed
+
+
+distance_cache = DistanceCache(maxsize=settings.DISTANCE_CACHE_SIZE)
+
+
+def get_distances(pairs):
+    return distance_cache.get_many(pairs)
+
+
+def invalidate_distances(location_id):
+    Distance.objects.filter(
+        Q(origin_id=location_id) | Q(destination_id=location_id)
+    ).delete()
+
+    def bump_version():
+        cache.add(DISTANCE_CACHE_VERSION_KEY, 0, timeout=None)
+        cache.incr(DISTANCE_CACHE_VERSION_KEY)
+
+    transaction.on_commit(bump_version)
@@ -0,0 +1,63 @@
+import csv
+import hashlib
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .addresses import normalize_address
+from .client import get_yandex_client
+
+
+HOUSE_NUMBER_PATTERN = re.compile(r'\d')
+
+
+class BaseGeocoder:
+    def fetch_coordinates(self, address):
+        raise NotImplementedError
+
+
+class YandexGeocoder(BaseGeocoder):
+    def fetch_coordinates(self, address):
+        return get_yandex_client().fetch_coordinates(address)
+
+
+class StubGeocoder(BaseGeocoder):
+    def fetch_coordinates(self, address):
+        digest = hashlib.sha1(address.encode('utf-8')).digest()
+        lat = 55.55 + digest[0] / 255 * 0.4
+        lon = 37.35 + digest[1] / 255 * 0.5
+        return f'{lat:.6f}', f'{lon:.6f}'
+
+
+class GazetteerGeocoder(BaseGeocoder):
+    # Справочник адресов из CSV с колонками address, latitude, longitude.
+    # Если точного совпадения нет, ищется самый длинный адрес справочника,
+    # с которого начинается запрос и который заканчивается номером дома:
+    # так «улица ленина 1 квартира 5» найдётся по «улица ленина 1».
+
+    def __init__(self, path=None):
+        self.path = path or settings.GAZETTEER_PATH
+        self.coords_by_address = {}
+        with open(self.path, encoding='utf-8', newline='') as gazetteer_file:
+            for row in csv.DictReader(gazetteer_file):
+                self.coords_by_address[normalize_address(row['address'])] = (
+                    row['latitude'],
+                    row['longitude'],
+                )
+
+    def fetch_coordinates(self, address):
+        tokens = normalize_address(address).split(' ')
+        for length in range(len(tokens), 0, -1):
+            if not HOUSE_NUMBER_PATTERN.search(tokens[length - 1]):
+                continue
+            coords = self.coords_by_address.get(' '.join(tokens[:length]))
+            if coords:
+                return coords
+        return None, None
+
+
+@lru_cache(maxsize=None)
+def get_geocoder(path):
+    return import_string(path)()
@@ -0,0 +1,29 @@
+import csv
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from geodata.models import Location
+
+
+class Command(BaseCommand):
+    help = 'Выгружает найденные координаты адресов в CSV-справочник для офлайн-геокодера'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=settings.GAZETTEER_PATH)
+
+    def handle(self, *args, **options):
+        locations = (
+            Location.objects
+            .filter(latitude__isnull=False, longitude__isnull=False)
+            .order_by('normalized_address')
+            .values_list('normalized_address', 'latitude', 'longitude')
+        )
+        with open(options['output'], 'w', encoding='utf-8', newline='') as gazetteer_file:
+            writer = csv.writer(gazetteer_file)
+            writer.writerow(['address', 'latitude', 'longitude'])
+            count = 0
+            for row in locations.iterator():
+                writer.writerow(row)
+                count += 1
+        self.stdout.write(f'Выгружено адресов: {count}')
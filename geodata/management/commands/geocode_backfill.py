@@ -0,0 +1,132 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from foodcartapp.models import Order, Restaurant
+from geodata.addresses import normalize_address
+from geodata.client import GeocoderUnavailable, RateLimiter
+from geodata.distance_cache import invalidate_distances
+from geodata.models import Location
+from geodata.signals import coordinates_changed, location_moved
+from geodata.utils import fetch_coordinates
+
+
+class Command(BaseCommand):
+    help = (
+        'Определяет координаты адресов заказов и ресторанов, для которых '
+        'их ещё нет. Уже записанные результаты не запрашиваются повторно, '
+        'поэтому прерванную команду можно просто запустить снова.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--rps', type=float, default=10, help='Не больше стольких запросов в секунду')
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        addresses = self.get_missing_addresses()
+        total = len(addresses)
+        self.stdout.write(f'Адресов без координат: {total}')
+
+        rate_limiter = RateLimiter(options['rps'])
+
+        def geocode(address):
+            rate_limiter.wait()
+            return fetch_coordinates(address)
+
+        done = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for start in range(0, total, options['batch_size']):
+                batch = addresses[start:start + options['batch_size']]
+                futures = [
+                    (address, executor.submit(geocode, address))
+                    for address in batch
+                ]
+                results = {}
+                is_unavailable = False
+                for address, future in futures:
+                    try:
+                        results[address] = future.result()
+                    except GeocoderUnavailable:
+                        is_unavailable = True
+                    except requests.RequestException as error:
+                        self.stderr.write(f'{address}: {error}')
+
+                self.save_results(results)
+                done += len(results)
+                self.stdout.write(f'Обработано {done} из {total}')
+
+                if is_unavailable:
+                    self.stderr.write('Геокодер недоступен, запустите команду позже')
+                    return
+
+    def get_missing_addresses(self):
+        addresses_by_key = {}
+        for address in [
+            *Restaurant.objects.values_list('address', flat=True).distinct(),
+            *Order.objects.values_list('address', flat=True).distinct(),
+        ]:
+            key = normalize_address(address)
+            if key:
+                addresses_by_key.setdefault(key, address.strip())
+
+        locations = Location.objects.filter(normalized_address__in=addresses_by_key)
+        for location in locations:
+            if not location.needs_lookup():
+                addresses_by_key.pop(location.normalized_address, None)
+        return list(addresses_by_key.values())
+
+    def save_results(self, results):
+        now = timezone.now()
+        existing = {
+            location.normalized_address: location
+            for location in Location.objects.filter(
+                normalized_address__in=[normalize_address(address) for address in results]
+            )
+        }
+
+        new_locations = []
+        updated_locations = []
+        previous_coordinates = {}
+        for address, (lat, lon) in results.items():
+            key = normalize_address(address)
+            location = existing.get(key)
+            if location is None:
+                location = Location(address=address, normalized_address=key)
+                new_locations.append(location)
+            else:
+                updated_locations.append(location)
+                previous_coordinates[location.pk] = (location.latitude, location.longitude)
+
+            location.date_of_request = now
+            location.lookups += 1
+            if lat is not None and lon is not None:
+                location.latitude = lat
+                location.longitude = lon
+                location.lookup_status = 'found'
+                location.failed_lookups = 0
+            else:
+                location.lookup_status = 'not_found'
+                location.failed_lookups += 1
+
+        Location.objects.bulk_create(new_locations, ignore_conflicts=True)
+        Location.objects.bulk_update(updated_locations, [
+            'latitude',
+            'longitude',
+            'date_of_request',
+            'lookup_status',
+            'failed_lookups',
+            'lookups',
+        ])
+
+        # bulk_update не отправляет сигналов, поэтому расстояния до
+        # переехавших адресов сбрасываются здесь.
+        for location in updated_locations:
+            coordinates = (location.latitude, location.longitude)
+            if None in coordinates:
+                continue
+            if coordinates_changed(previous_coordinates[location.pk], coordinates):
+                invalidate_distances(location.pk)
+                location_moved.send(sender=Location, instance=location)
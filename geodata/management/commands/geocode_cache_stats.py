@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+
+from geodata.models import Location
+
+
+class Command(BaseCommand):
+    help = 'Показывает эффективность кэша координат адресов'
+
+    def handle(self, *args, **options):
+        totals = Location.objects.aggregate(
+            hits=Sum('cache_hits'),
+            negative_hits=Sum('negative_hits'),
+            lookups=Sum('lookups'),
+        )
+        hits = totals['hits'] or 0
+        negative_hits = totals['negative_hits'] or 0
+        misses = totals['lookups'] or 0
+        requests_count = hits + misses
+
+        def rate(value):
+            return f'{value / requests_count:.1%}' if requests_count else '—'
+
+        self.stdout.write(f'Обращений к кэшу: {requests_count}')
+        self.stdout.write(f'Попадания: {hits} ({rate(hits)})')
+        self.stdout.write(f'Промахи, запросы к геокодеру: {misses} ({rate(misses)})')
+        self.stdout.write(f'Попадания без координат: {negative_hits} ({rate(negative_hits)})')
+
+        self.stdout.write('')
+        statuses = dict(Location.LOOKUP_STATUS_CHOICES)
+        by_status = (
+            Location.objects
+            .values('lookup_status')
+            .annotate(count=Count('pk'))
+            .order_by('lookup_status')
+        )
+        for row in by_status:
+            self.stdout.write(f'{statuses[row["lookup_status"]]}: {row["count"]}')
+
+        expired = sum(1 for location in Location.objects.iterator() if location.needs_lookup())
+        self.stdout.write(f'Требуют обновления: {expired}')
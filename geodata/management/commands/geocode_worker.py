@@ -0,0 +1,40 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from geodata.client import get_yandex_client
+from geodata.utils import process_geocoding_jobs
+
+
+class Command(BaseCommand):
+    help = 'Обрабатывает очередь геокодирования адресов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--max-attempts', type=int, default=5)
+        parser.add_argument(
+            '--retry-delay',
+            type=int,
+            default=30,
+            help='Задержка перед первым повтором, сек. Каждый следующий повтор ждёт вдвое дольше.',
+        )
+        parser.add_argument('--sleep', type=float, default=2, help='Пауза, когда очередь пуста, сек.')
+        parser.add_argument('--once', action='store_true', help='Обработать одну пачку и выйти')
+
+    def handle(self, *args, **options):
+        while True:
+            jobs = process_geocoding_jobs(
+                batch_size=options['batch_size'],
+                max_attempts=options['max_attempts'],
+                retry_delay=timedelta(seconds=options['retry_delay']),
+            )
+            for job in jobs:
+                self.stdout.write(f'{job.status}: {job.address}')
+            if jobs and options['verbosity'] >= 2:
+                self.stdout.write(f'Геокодер: {get_yandex_client().stats()}')
+
+            if options['once']:
+                break
+            if not jobs:
+                time.sleep(options['sleep'])
@@ -0,0 +1,47 @@
+# Generated by Django 3.2.15 on 2026-10-18 19:05
+
+from django.db import migrations, models
+
+
+def fill_lookup_status(apps, schema_editor):
+    Location = apps.get_model('geodata', 'Location')
+    Location.objects.filter(
+        latitude__isnull=False,
+        longitude__isnull=False,
+    ).update(lookup_status='found')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geodata', '0003_location_normalized_address'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='cache_hits',
+            field=models.PositiveIntegerField(default=0, verbose_name='Попаданий в кэш'),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='failed_lookups',
+            field=models.PositiveIntegerField(default=0, verbose_name='Неудачных запросов подряд'),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='lookup_status',
+            field=models.CharField(blank=True, choices=[('', 'Не запрашивался'), ('found', 'Найден'), ('not_found', 'Не найден')], db_index=True, max_length=20, verbose_name='Результат запроса'),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='lookups',
+            field=models.PositiveIntegerField(default=0, verbose_name='Запросов к геокодеру'),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='negative_hits',
+            field=models.PositiveIntegerField(default=0, verbose_name='Попаданий в кэш без координат'),
+        ),
+        migrations.RunPython(fill_lookup_status, migrations.RunPython.noop),
+    ]
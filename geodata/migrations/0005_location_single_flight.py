@@ -0,0 +1,43 @@
+# Generated by Django 3.2.15 on 2026-10-18 19:40
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def remove_duplicate_locations(apps, schema_editor):
+    Location = apps.get_model('geodata', 'Location')
+    duplicated_addresses = (
+        Location.objects
+        .values('normalized_address')
+        .annotate(count=Count('pk'))
+        .filter(count__gt=1)
+        .values_list('normalized_address', flat=True)
+    )
+    for normalized_address in list(duplicated_addresses):
+        locations = Location.objects.filter(normalized_address=normalized_address)
+        kept = (
+            locations.filter(latitude__isnull=False, longitude__isnull=False).order_by('pk').first()
+            or locations.order_by('pk').first()
+        )
+        locations.exclude(pk=kept.pk).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geodata', '0004_location_lookup_status'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_locations, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='location',
+            name='normalized_address',
+            field=models.CharField(editable=False, max_length=255, unique=True, verbose_name='Нормализованный адрес'),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='lookup_started_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Запрос выполняется с'),
+        ),
+    ]
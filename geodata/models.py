@@ -1,9 +1,20 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.db import models
 from django.utils import timezone
 
+from .addresses import normalize_address
+
 
 class Location(models.Model):
     address = models.CharField('Адрес', max_length=255, unique=True)
+    normalized_address = models.CharField(
+        'Нормализованный адрес',
+        max_length=255,
+        unique=True,
+        editable=False,
+    )
     latitude = models.DecimalField(
         'Широта',
         max_digits=9,
@@ -23,5 +34,105 @@ class Location(models.Model):
         default=timezone.now
     )
 
+    LOOKUP_STATUS_CHOICES = [
+        ('', 'Не запрашивался'),
+        ('found', 'Найден'),
+        ('not_found', 'Не найден'),
+    ]
+
+    lookup_status = models.CharField(
+        'Результат запроса',
+        max_length=20,
+        choices=LOOKUP_STATUS_CHOICES,
+        blank=True,
+        db_index=True,
+    )
+    lookup_started_at = models.DateTimeField(
+        'Запрос выполняется с',
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    failed_lookups = models.PositiveIntegerField('Неудачных запросов подряд', default=0)
+    cache_hits = models.PositiveIntegerField('Попаданий в кэш', default=0)
+    negative_hits = models.PositiveIntegerField('Попаданий в кэш без координат', default=0)
+    lookups = models.PositiveIntegerField('Запросов к геокодеру', default=0)
+
+    def __str__(self):
+        return self.address
+
+    def save(self, *args, **kwargs):
+        self.normalized_address = normalize_address(self.address)
+        super().save(*args, **kwargs)
+
+    def get_expiration_date(self):
+        if self.lookup_status == 'found':
+            return self.date_of_request + timedelta(seconds=settings.GEOCODE_REFRESH_TTL)
+        if self.lookup_status == 'not_found':
+            backoff = settings.GEOCODE_NEGATIVE_TTL * 2 ** max(self.failed_lookups - 1, 0)
+            return self.date_of_request + timedelta(
+                seconds=min(backoff, settings.GEOCODE_NEGATIVE_TTL_MAX)
+            )
+        return None
+
+    def needs_lookup(self):
+        expiration_date = self.get_expiration_date()
+        return expiration_date is None or expiration_date <= timezone.now()
+
+
+class GeocodingJob(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'В очереди'),
+        ('done', 'Выполнено'),
+        ('failed', 'Ошибка'),
+    ]
+
+    address = models.CharField('Адрес', max_length=255, unique=True)
+    status = models.CharField(
+        'Статус',
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='pending',
+        db_index=True,
+    )
+    attempts = models.PositiveIntegerField('Попыток', default=0)
+    next_attempt_at = models.DateTimeField(
+        'Следующая попытка',
+        default=timezone.now,
+        db_index=True,
+    )
+    last_error = models.TextField('Последняя ошибка', blank=True)
+    created_at = models.DateTimeField('Создано', default=timezone.now)
+
+    class Meta:
+        verbose_name = 'задача геокодирования'
+        verbose_name_plural = 'задачи геокодирования'
+
+    def __str__(self):
+        return self.address
+
+
+class Distance(models.Model):
+    origin = models.ForeignKey(
+        Location,
+        verbose_name='Откуда',
+        related_name='distances_from',
+        on_delete=models.CASCADE,
+    )
+    destination = models.ForeignKey(
+        Location,
+        verbose_name='Куда',
+        related_name='distances_to',
+        on_delete=models.CASCADE,
+    )
+    km = models.FloatField('Расстояние, км')
+
+    class Meta:
+        verbose_name = 'расстояние'
+        verbose_name_plural = 'расстояния'
+        unique_together = [
+            ['origin', 'destination']
+        ]
+
     def __str__(self):
-        return self.address
\ No newline at end of file
+        return f'{self.origin} — {self.destination}'
@@ -0,0 +1,53 @@
+from decimal import Decimal
+
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import Signal, receiver
+
+from .distance_cache import invalidate_distances
+from .models import Location
+
+
+# Отправляется, когда у адреса появились или поменялись координаты, уже после
+# сброса закэшированных расстояний до него.
+location_moved = Signal()
+
+
+COORDINATE_PRECISION = Decimal('0.000001')
+
+
+def normalize_coordinates(coordinates):
+    # Из БД координаты приходят Decimal, а от геокодера — строками, поэтому
+    # сравнивать их можно только после приведения к точности поля.
+    return tuple(
+        None if value is None else Decimal(str(value)).quantize(COORDINATE_PRECISION)
+        for value in coordinates
+    )
+
+
+def coordinates_changed(previous_coordinates, coordinates):
+    return normalize_coordinates(previous_coordinates) != normalize_coordinates(coordinates)
+
+
+@receiver(pre_save, sender=Location)
+def remember_location_coordinates(sender, instance, **kwargs):
+    instance.previous_coordinates = None
+    if instance.pk:
+        instance.previous_coordinates = (
+            Location.objects
+            .filter(pk=instance.pk)
+            .values_list('latitude', 'longitude')
+            .first()
+        )
+
+
+@receiver(post_save, sender=Location)
+def invalidate_distances_on_move(sender, instance, created, **kwargs):
+    previous_coordinates = getattr(instance, 'previous_coordinates', None)
+    coordinates = (instance.latitude, instance.longitude)
+    if created or previous_coordinates is None:
+        if None not in coordinates:
+            location_moved.send(sender=Location, instance=instance)
+        return
+    if coordinates_changed(previous_coordinates, coordinates):
+        invalidate_distances(instance.pk)
+        location_moved.send(sender=Location, instance=instance)
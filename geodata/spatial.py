@@ -0,0 +1,92 @@
+import heapq
+import math
+
+import numpy as np
+
+from .distances import EARTH_RADIUS_KM
+
+
+def to_unit_vectors(coords):
+    coords = np.radians(np.asarray(coords, dtype=float).reshape(-1, 2))
+    lat, lon = coords[:, 0], coords[:, 1]
+    return np.column_stack([
+        np.cos(lat) * np.cos(lon),
+        np.cos(lat) * np.sin(lon),
+        np.sin(lat),
+    ])
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * math.asin(min(chord / 2, 1.0))
+
+
+def km_to_chord(km):
+    return 2 * math.sin(min(km / EARTH_RADIUS_KM, math.pi) / 2)
+
+
+class SpatialIndex:
+    # KD-дерево по точкам на единичной сфере: евклидово расстояние между
+    # векторами (хорда) растёт вместе с расстоянием по поверхности Земли,
+    # поэтому ближайшие по хорде точки — ближайшие и на карте.
+
+    def __init__(self, points):
+        points = list(points)
+        self.keys = [key for key, _, _ in points]
+        self.coords = {key: (lat, lon) for key, lat, lon in points}
+        self.vectors = to_unit_vectors([(lat, lon) for _, lat, lon in points])
+        self._root = self._build(list(range(len(self.keys))), depth=0)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.coords
+
+    def nearest(self, lat, lon, k=1, radius_km=None, predicate=None):
+        if not self.keys or k < 1:
+            return []
+
+        target = to_unit_vectors([(lat, lon)])[0]
+        max_chord = km_to_chord(radius_km) if radius_km is not None else math.inf
+        found = []
+
+        def bound():
+            if len(found) < k:
+                return max_chord
+            return min(max_chord, -found[0][0])
+
+        def visit(node):
+            if node is None:
+                return
+            point, axis, left, right = node
+            chord = float(np.linalg.norm(self.vectors[point] - target))
+            key = self.keys[point]
+            if chord <= bound() and (predicate is None or predicate(key)):
+                heapq.heappush(found, (-chord, point))
+                if len(found) > k:
+                    heapq.heappop(found)
+
+            delta = target[axis] - self.vectors[point][axis]
+            near, far = (left, right) if delta < 0 else (right, left)
+            visit(near)
+            if abs(delta) <= bound():
+                visit(far)
+
+        visit(self._root)
+        return [
+            (self.keys[point], chord_to_km(-chord))
+            for chord, point in sorted(found, reverse=True)
+        ]
+
+    def _build(self, points, depth):
+        if not points:
+            return None
+        axis = depth % 3
+        points.sort(key=lambda point: self.vectors[point][axis])
+        middle = len(points) // 2
+        return (
+            points[middle],
+            axis,
+            self._build(points[:middle], depth + 1),
+            self._build(points[middle + 1:], depth + 1),
+        )
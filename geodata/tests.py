@@ -1,3 +1,399 @@
-from django.test import TestCase
+import json
+import random
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from geopy import distance
+
+from .addresses import normalize_address
+from .client import GeocoderClient, GeocoderUnavailable, RateLimiter
+from .distance_cache import DistanceCache
+from .distances import haversine_matrix
+from .models import Distance, GeocodingJob, Location
+from .spatial import SpatialIndex
+from .signals import location_moved
+from .utils import (
+    claim_lookup,
+    enqueue_geocoding,
+    get_or_create_location,
+    process_geocoding_jobs,
+    single_flight,
+)
+
+
+class NormalizeAddressTest(SimpleTestCase):
+    def test_spellings_of_one_address_share_a_key(self):
+        spellings = ['ул. Ленина, 1', 'улица Ленина 1', '  УЛИЦА   ленина,1 ', 'Ул Ленина д 1']
+        self.assertEqual(
+            {normalize_address(address) for address in spellings},
+            {'улица ленина 1'},
+        )
+
+    def test_abbreviations_are_expanded(self):
+        self.assertEqual(normalize_address('пр-т Мира, 1 к 2'), 'проспект мира 1 корпус 2')
+        self.assertEqual(
+            normalize_address('Пр-д Серебрякова, 14 стр. 3'),
+            'проезд серебрякова 14 строение 3',
+        )
+
+    def test_city_and_house_words_are_dropped(self):
+        self.assertEqual(
+            normalize_address('г. Москва, ул. Тверская, д. 1'),
+            'москва улица тверская 1',
+        )
+
+    def test_yo_and_slashes(self):
+        self.assertEqual(normalize_address('Королёва ул., 5/2'), 'королева улица 5/2')
+
+
+class CacheHitTest(TestCase):
+    def test_cache_hit_is_counted_after_commit(self):
+        location = Location.objects.create(
+            address='Москва, Тверская улица, 1',
+            latitude='55.76',
+            longitude='37.61',
+            lookup_status='found',
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue_geocoding('Москва, Тверская улица, 1')
+            location.refresh_from_db()
+            self.assertEqual(location.cache_hits, 0)
+
+        location.refresh_from_db()
+        self.assertEqual(location.cache_hits, 1)
+
+
+class SingleFlightTest(SimpleTestCase):
+    def run_concurrently(self, func, count=5):
+        results = []
+        errors = []
+
+        def call():
+            try:
+                results.append(single_flight('улица ленина 1', func))
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=call) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        # Даём всем потокам дойти до ожидания ведущего.
+        time.sleep(0.2)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        return results, errors
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.calls = 0
+
+    def test_concurrent_callers_share_one_call(self):
+        def fetch():
+            self.calls += 1
+            self.release.wait()
+            return ('55.76', '37.61')
+
+        results, errors = self.run_concurrently(fetch)
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [('55.76', '37.61')] * 5)
+        self.assertEqual(errors, [])
+
+    def test_error_reaches_every_waiter(self):
+        def fetch():
+            self.calls += 1
+            self.release.wait()
+            raise requests.ConnectionError('geocoder')
+
+        results, errors = self.run_concurrently(fetch)
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [])
+        self.assertEqual(len(errors), 5)
+
+    def test_next_call_after_flight_runs_again(self):
+        self.release.set()
+        self.assertEqual(single_flight('улица ленина 1', lambda: 1), 1)
+        self.assertEqual(single_flight('улица ленина 1', lambda: 2), 2)
+
+
+@override_settings(GEOCODE_LOOKUP_LEASE=60)
+class ClaimLookupTest(TestCase):
+    def setUp(self):
+        self.location = Location.objects.create(address='Москва, Тверская улица, 1')
+
+    def test_only_one_process_claims_lookup(self):
+        self.assertTrue(claim_lookup(self.location))
+        self.assertFalse(claim_lookup(self.location))
+
+        self.location.refresh_from_db()
+        self.assertEqual(self.location.lookups, 1)
+        self.assertIsNotNone(self.location.lookup_started_at)
+
+    def test_expired_claim_is_taken_over(self):
+        Location.objects.filter(pk=self.location.pk).update(
+            lookup_started_at=timezone.now() - timedelta(seconds=61),
+        )
+        self.assertTrue(claim_lookup(self.location))
+
+    def test_same_address_is_geocoded_once(self):
+        with mock.patch('geodata.utils.fetch_coordinates', return_value=('55.76', '37.61')) as fetch:
+            first = get_or_create_location('г. Москва, Тверская ул., д. 1')
+            second = get_or_create_location('москва,  Тверская улица 1')
+
+        fetch.assert_called_once()
+        self.assertEqual(first.pk, self.location.pk)
+        self.assertEqual(second.pk, self.location.pk)
+        self.assertEqual(Location.objects.count(), 1)
+
+
+class LocationMovedTest(TestCase):
+    def setUp(self):
+        self.location = Location.objects.create(
+            address='Москва, Тверская улица, 1',
+            latitude='55.760000',
+            longitude='37.610000',
+            lookup_status='found',
+        )
+        self.location.refresh_from_db()
+        self.receiver = mock.Mock()
+        location_moved.connect(self.receiver)
+        self.addCleanup(location_moved.disconnect, self.receiver)
+
+    def test_same_coordinates_from_geocoder_are_not_a_move(self):
+        self.location.latitude = '55.76'
+        self.location.longitude = '37.6100001'
+        self.location.save()
+
+        self.receiver.assert_not_called()
+
+    def test_new_coordinates_are_a_move(self):
+        self.location.latitude = '55.77'
+        self.location.save()
+
+        self.receiver.assert_called_once()
+
+
+class GeocodingJobsTest(TestCase):
+    def test_unexpected_error_spends_an_attempt(self):
+        GeocodingJob.objects.create(address='Москва, Тверская улица, 1')
+        GeocodingJob.objects.create(address='Москва, Арбат, 1')
+
+        with mock.patch('geodata.utils.fetch_coordinates', side_effect=KeyError('GeoObject')):
+            process_geocoding_jobs(max_attempts=2)
+        with mock.patch('geodata.utils.fetch_coordinates', side_effect=KeyError('GeoObject')):
+            jobs = process_geocoding_jobs(max_attempts=2)
+        self.assertEqual(jobs, [])
+
+        for job in GeocodingJob.objects.all():
+            self.assertEqual(job.attempts, 1)
+            self.assertEqual(job.status, 'pending')
+            self.assertIn('KeyError', job.last_error)
+
+    def test_job_fails_after_max_attempts(self):
+        GeocodingJob.objects.create(address='Москва, Тверская улица, 1')
+
+        with mock.patch('geodata.utils.fetch_coordinates', side_effect=FileNotFoundError('gazetteer.csv')):
+            process_geocoding_jobs(max_attempts=1)
+
+        self.assertEqual(GeocodingJob.objects.get().status, 'failed')
+
+
+class DistanceCacheTest(TestCase):
+    def test_missing_pairs_are_computed_in_one_batch(self):
+        addresses = [
+            Location.objects.create(address='Москва, Тверская улица, 1', latitude='55.76', longitude='37.61'),
+            Location.objects.create(address='Москва, Арбат, 1', latitude='55.75', longitude='37.59'),
+        ]
+        restaurants = [
+            Location.objects.create(address='Москва, Ленинский проспект, 1', latitude='55.70', longitude='37.58'),
+            Location.objects.create(address='Москва, проспект Мира, 1', latitude='55.78', longitude='37.63'),
+        ]
+        pairs = [(origin.pk, destination.pk) for origin in addresses for destination in restaurants]
+        distance_cache = DistanceCache(maxsize=10)
+
+        with mock.patch('geodata.distance_cache.haversine_matrix', wraps=haversine_matrix) as matrix:
+            distances = distance_cache.get_many(pairs)
+        matrix.assert_called_once()
+
+        for origin in addresses:
+            for destination in restaurants:
+                expected = distance.distance(
+                    (origin.latitude, origin.longitude),
+                    (destination.latitude, destination.longitude),
+                ).km
+                self.assertAlmostEqual(distances[origin.pk, destination.pk], expected, delta=expected * 0.005)
+        self.assertEqual(Distance.objects.count(), len(pairs))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(distance_cache.get_many(pairs), distances)
+
+
+class SpatialIndexTest(SimpleTestCase):
+    def setUp(self):
+        generator = random.Random(5)
+        self.points = [
+            (key, 55.5 + generator.random() * 0.5, 37.3 + generator.random() * 0.6)
+            for key in range(300)
+        ]
+        self.targets = [
+            (55.5 + generator.random() * 0.5, 37.3 + generator.random() * 0.6)
+            for _ in range(20)
+        ]
+        self.index = SpatialIndex(self.points)
+
+    def brute_force(self, lat, lon, k, radius_km=None, predicate=None):
+        distances = haversine_matrix([(lat, lon)], [(lat, lon) for _, lat, lon in self.points])[0]
+        found = sorted(
+            (km, key)
+            for (key, _, _), km in zip(self.points, distances)
+            if (radius_km is None or km <= radius_km) and (predicate is None or predicate(key))
+        )
+        return [(key, km) for km, key in found[:k]]
+
+    def assert_same_neighbours(self, found, expected):
+        self.assertEqual([key for key, _ in found], [key for key, _ in expected])
+        for (_, km), (_, expected_km) in zip(found, expected):
+            self.assertAlmostEqual(km, expected_km, places=6)
+
+    def test_nearest_matches_brute_force(self):
+        for lat, lon in self.targets:
+            self.assert_same_neighbours(
+                self.index.nearest(lat, lon, k=5),
+                self.brute_force(lat, lon, k=5),
+            )
+
+    def test_radius_and_predicate_cut_candidates(self):
+        def is_even(key):
+            return key % 2 == 0
+
+        for lat, lon in self.targets:
+            self.assert_same_neighbours(
+                self.index.nearest(lat, lon, k=10, radius_km=3, predicate=is_even),
+                self.brute_force(lat, lon, k=10, radius_km=3, predicate=is_even),
+            )
+
+    def test_empty_index(self):
+        self.assertEqual(SpatialIndex([]).nearest(55.75, 37.61, k=3), [])
+
+
+FOUND_RESPONSE = {
+    'response': {
+        'GeoObjectCollection': {
+            'featureMember': [{'GeoObject': {'Point': {'pos': '37.61 55.76'}}}],
+        },
+    },
+}
+
+
+class GeocoderStandIn(ThreadingHTTPServer):
+    # Локальная замена геокодера: отвечает по очереди кодами из responses,
+    # а когда они кончаются — найденным адресом.
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), GeocoderStandInHandler)
+        self.responses = []
+        self.requests_count = 0
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}/'
+
+
+class GeocoderStandInHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests_count += 1
+        status = self.server.responses.pop(0) if self.server.responses else 200
+        body = json.dumps(FOUND_RESPONSE if status == 200 else {}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class GeocoderClientTest(SimpleTestCase):
+    def setUp(self):
+        self.server = GeocoderStandIn()
+        thread = threading.Thread(target=self.server.serve_forever, args=[0.01], daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def make_client(self, **kwargs):
+        options = {'max_retries': 2, 'backoff': 0, 'failure_threshold': 2, 'recovery_timeout': 60}
+        options.update(kwargs)
+        client = GeocoderClient(self.server.url, 'apikey', **options)
+        self.addCleanup(client.session.close)
+        return client
+
+    def test_retries_server_errors_with_backoff(self):
+        self.server.responses = [503, 502]
+        client = self.make_client(backoff=0.01)
+
+        with mock.patch('geodata.client.time.sleep') as sleep:
+            self.assertEqual(client.fetch_coordinates('Москва'), ('55.76', '37.61'))
+
+        self.assertEqual(self.server.requests_count, 3)
+        self.assertEqual(client.stats()['retries'], 2)
+        first_delay, second_delay = [call.args[0] for call in sleep.call_args_list]
+        self.assertTrue(0.005 <= first_delay <= 0.015)
+        self.assertTrue(0.01 <= second_delay <= 0.03)
+
+    def test_client_errors_are_not_retried(self):
+        self.server.responses = [400]
+        client = self.make_client()
+
+        with self.assertRaises(requests.HTTPError):
+            client.fetch_coordinates('Москва')
+        self.assertEqual(self.server.requests_count, 1)
+
+    def test_open_breaker_fails_fast(self):
+        self.server.responses = [500] * 6
+        client = self.make_client()
+
+        for _ in range(2):
+            with self.assertRaises(requests.HTTPError):
+                client.fetch_coordinates('Москва')
+        with self.assertRaises(GeocoderUnavailable):
+            client.fetch_coordinates('Москва')
+
+        self.assertEqual(self.server.requests_count, 6)
+        stats = client.stats()
+        self.assertEqual(stats['short_circuited'], 1)
+        self.assertTrue(stats['circuit_open'])
+
+    def test_half_open_breaker_lets_one_trial_through(self):
+        self.server.responses = [500] * 6
+        client = self.make_client(recovery_timeout=0.05)
+        for _ in range(2):
+            with self.assertRaises(requests.HTTPError):
+                client.fetch_coordinates('Москва')
+        time.sleep(0.1)
+
+        self.assertTrue(client.breaker.allow_request())
+        self.assertFalse(client.breaker.allow_request())
+        client.breaker.record_failure()
+        self.assertFalse(client.breaker.allow_request())
+
+        time.sleep(0.1)
+        self.assertEqual(client.fetch_coordinates('Москва'), ('55.76', '37.61'))
+        self.assertFalse(client.stats()['circuit_open'])
+
+    def test_rate_limiter_spaces_requests(self):
+        rate_limiter = RateLimiter(rate=50)
+        started_at = time.monotonic()
+        for _ in range(6):
+            rate_limiter.wait()
+        self.assertGreaterEqual(time.monotonic() - started_at, 5 / 50)
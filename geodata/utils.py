@@ -1,32 +1,225 @@
+import threading
+import time
+from datetime import timedelta
+
 import requests
-from .models import Location
 from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .addresses import normalize_address
+from .client import GeocoderUnavailable
+from .geocoders import get_geocoder
+from .models import GeocodingJob, Location
+
+
+def fetch_coordinates(address):
+    try:
+        return get_geocoder(settings.GEOCODER).fetch_coordinates(address)
+    except requests.RequestException:
+        if not settings.GEOCODER_FALLBACK:
+            raise
+        lat, lon = get_geocoder(settings.GEOCODER_FALLBACK).fetch_coordinates(address)
+        if lat is None or lon is None:
+            # Резервный геокодер не знает адреса. Это не повод запоминать
+            # отрицательный ответ: пусть вызывающий повторит запрос позже.
+            raise
+        return lat, lon
+
+
+class Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_flights = {}
+_flights_lock = threading.Lock()
 
 
-def fetch_coordinates_from_yandex(address):
-    base_url = "https://geocode-maps.yandex.ru/1.x"
-    response = requests.get(base_url, params={
-        "geocode": address,
-        "apikey": settings.YANDEX_APIKEY,
-        "format": "json",
-    })
-    response.raise_for_status()
-    found_places = response.json()['response']['GeoObjectCollection']['featureMember']
+def single_flight(key, func):
+    with _flights_lock:
+        flight = _flights.get(key)
+        is_leader = flight is None
+        if is_leader:
+            flight = _flights[key] = Flight()
 
-    if not found_places:
-        return None, None
+    if not is_leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
 
-    most_relevant = found_places[0]
-    lon, lat = most_relevant['GeoObject']['Point']['pos'].split(" ")
-    return lat, lon
+    try:
+        flight.result = func()
+    except Exception as error:
+        flight.error = error
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+    return flight.result
 
 
 def get_or_create_location(address):
-    location, created = Location.objects.get_or_create(address=address)
-    if created or not location.latitude or not location.longitude:
-        lat, lon = fetch_coordinates_from_yandex(address)
-        if lat is not None and lon is not None:
-            location.latitude = lat
-            location.longitude = lon
-            location.save()
-    return location
\ No newline at end of file
+    normalized_address = normalize_address(address)
+    return single_flight(
+        normalized_address,
+        lambda: locate(address, normalized_address),
+    )
+
+
+def locate(address, normalized_address):
+    # Между процессами запрос согласуется через строку Location: кто занял
+    # lookup_started_at, тот и обращается к геокодеру, а остальные
+    # перечитывают строку, пока не появится результат или не истечёт захват.
+    location, created = Location.objects.get_or_create(
+        normalized_address=normalized_address,
+        defaults={'address': address},
+    )
+    deadline = time.monotonic() + settings.GEOCODE_LOOKUP_WAIT
+    while True:
+        if not location.needs_lookup():
+            record_cache_hit(location)
+            return location
+        if claim_lookup(location):
+            return lookup_coordinates(location, address)
+        if time.monotonic() >= deadline:
+            return location
+        time.sleep(0.1)
+        location.refresh_from_db()
+
+
+def claim_lookup(location):
+    now = timezone.now()
+    lease_expired_at = now - timedelta(seconds=settings.GEOCODE_LOOKUP_LEASE)
+    return bool(
+        Location.objects
+        .filter(pk=location.pk)
+        .filter(Q(lookup_started_at__isnull=True) | Q(lookup_started_at__lt=lease_expired_at))
+        .update(lookup_started_at=now, lookups=F('lookups') + 1)
+    )
+
+
+def lookup_coordinates(location, address):
+    try:
+        lat, lon = fetch_coordinates(address)
+    except Exception:
+        Location.objects.filter(pk=location.pk).update(lookup_started_at=None)
+        raise
+
+    location.refresh_from_db(fields=['failed_lookups'])
+    location.date_of_request = timezone.now()
+    location.lookup_started_at = None
+    if lat is not None and lon is not None:
+        location.latitude = lat
+        location.longitude = lon
+        location.lookup_status = 'found'
+        location.failed_lookups = 0
+    else:
+        location.lookup_status = 'not_found'
+        location.failed_lookups += 1
+    location.save(update_fields=[
+        'latitude',
+        'longitude',
+        'date_of_request',
+        'lookup_started_at',
+        'lookup_status',
+        'failed_lookups',
+    ])
+    return location
+
+
+def find_location(address):
+    return Location.objects.filter(
+        normalized_address=normalize_address(address),
+    ).first()
+
+
+def record_cache_hit(location):
+    # Счётчики увеличиваются после коммита. Внутри транзакции заказа UPDATE
+    # держал бы блокировку строки адреса до её конца, и параллельные заказы
+    # на один адрес снова выстраивались бы в очередь.
+    counters = {'cache_hits': F('cache_hits') + 1}
+    if location.lookup_status != 'found':
+        counters['negative_hits'] = F('negative_hits') + 1
+    transaction.on_commit(lambda: Location.objects.filter(pk=location.pk).update(**counters))
+
+
+def enqueue_geocoding(address):
+    location = find_location(address)
+    if location is not None and not location.needs_lookup():
+        record_cache_hit(location)
+        return None
+
+    job, created = GeocodingJob.objects.get_or_create(address=address)
+    if not created and job.status != 'pending':
+        job.status = 'pending'
+        job.attempts = 0
+        job.next_attempt_at = timezone.now()
+        job.save(update_fields=['status', 'attempts', 'next_attempt_at'])
+    return job
+
+
+def claim_geocoding_jobs(batch_size, lease=timedelta(minutes=5)):
+    now = timezone.now()
+    candidates = (
+        GeocodingJob.objects
+        .filter(status='pending', next_attempt_at__lte=now)
+        .order_by('next_attempt_at')
+        .values_list('pk', 'next_attempt_at')[:batch_size]
+    )
+    claimed_ids = [
+        pk for pk, next_attempt_at in candidates
+        if GeocodingJob.objects
+        .filter(pk=pk, status='pending', next_attempt_at=next_attempt_at)
+        .update(next_attempt_at=now + lease)
+    ]
+    return list(GeocodingJob.objects.filter(pk__in=claimed_ids))
+
+
+def record_failed_attempt(job, error, max_attempts, retry_delay):
+    job.attempts += 1
+    job.last_error = error
+    if job.attempts >= max_attempts:
+        job.status = 'failed'
+    else:
+        job.next_attempt_at = timezone.now() + retry_delay * 2 ** (job.attempts - 1)
+
+
+def process_geocoding_jobs(batch_size=50, max_attempts=5, retry_delay=timedelta(seconds=30)):
+    jobs = claim_geocoding_jobs(batch_size)
+    for number, job in enumerate(jobs):
+        try:
+            location = get_or_create_location(job.address)
+        except GeocoderUnavailable as error:
+            # Геокодер недоступен: остаток пачки откладывается без траты
+            # попыток, а предохранитель сам пропустит пробный запрос.
+            for postponed_job in jobs[number:]:
+                postponed_job.last_error = str(error)
+                postponed_job.next_attempt_at = timezone.now() + retry_delay
+            break
+        except requests.RequestException as error:
+            record_failed_attempt(job, str(error), max_attempts, retry_delay)
+        except Exception as error:
+            # Неожиданный ответ геокодера или сломанный резервный геокодер не
+            # должны ронять воркер: задача тратит попытку, как при ошибке сети,
+            # иначе она так и осталась бы занятой и уронила бы его снова.
+            record_failed_attempt(job, f'{type(error).__name__}: {error}', max_attempts, retry_delay)
+        else:
+            if location.needs_lookup():
+                # Этот адрес ещё геокодирует другой процесс.
+                job.next_attempt_at = timezone.now() + retry_delay
+                continue
+            job.attempts += 1
+            job.status = 'done'
+            job.last_error = ''
+
+    GeocodingJob.objects.bulk_update(
+        jobs,
+        ['status', 'attempts', 'next_attempt_at', 'last_error'],
+    )
+    return jobs
@@ -1,3 +1,266 @@
-from django.test import TestCase
+import tempfile
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.auth.models import Group, User
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+
+from foodcartapp.availability import availability_index
+from foodcartapp.candidates import get_open_order_ids, refresh_order_candidates
+from foodcartapp.catalog import invalidate_catalog_snapshot
+from foodcartapp.models import (
+    Order,
+    OrderItem,
+    Product,
+    ProductCategory,
+    Restaurant,
+    RestaurantMenuItem,
+)
+from foodcartapp.restaurant_index import invalidate_restaurant_index
+from geodata.addresses import normalize_address
+from geodata.models import GeocodingJob, Location
+
+
+# Каждая страница открывается на базе разного размера. Число запросов к БД
+# должно быть одинаковым на всех масштабах: если оно растёт вместе с числом
+# строк, в код пробрался N+1. Время не проверяется: на медленной машине CI
+# такой тест падал бы случайно.
+SCALES = [5, 50]
+
+# Пути, которые проверяются отдельно или не являются страницами сайта.
+UNBUDGETED_PREFIXES = ['admin/', '__debug__/', 'media/']
+
+
+def make_coordinates(number):
+    return 55.6 + number % 37 * 0.01, 37.4 + number % 41 * 0.01
+
+
+class ViewBudgetTest(TestCase):
+    # (метод, путь, запросов не больше)
+    budgets = {
+        'start_page': ('get', '/', 0),
+        'api_products': ('get', '/api/products/', 3),
+        'api_banners': ('get', '/api/banners/', 0),
+        'api_order': ('post', '/api/order/', 10),
+        'api_api_order': ('post', '/api/api/order/', 10),
+        'api_orders_batch': ('post_batch', '/api/orders/batch/', 14),
+        'manager': ('get', '/manager/', 0),
+        'manager_products': ('get', '/manager/products/', 5),
+        'manager_restaurants': ('get', '/manager/restaurants/', 3),
+        'manager_orders': ('get', '/manager/orders/', 6),
+        'manager_order_events': ('get', '/manager/orders/events/?timeout=0', 4),
+        'manager_login': ('get', '/manager/login/', 0),
+        'manager_logout': ('get', '/manager/logout/', 4),
+        'api_auth_login': ('get', '/api-auth/login/', 0),
+        'api_auth_logout': ('get', '/api-auth/logout/', 4),
+    }
+    admin_changelist_budget = 8
+    admin_add_budget = 8
+    admin_change_budget = 12
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_superuser('manager', 'manager@example.com', 'password')
+        Group.objects.create(name='Менеджеры')
+
+    def setUp(self):
+        self.client.force_login(self.manager)
+
+    def seed(self, scale):
+        category = ProductCategory.objects.create(name='Бургеры')
+        Product.objects.bulk_create(
+            Product(
+                name=f'Бургер {number}',
+                category=category,
+                price=100 + number,
+                image='burger.jpg',
+            )
+            for number in range(scale)
+        )
+        products = list(Product.objects.order_by('pk'))
+
+        restaurants = []
+        for number in range(max(scale // 5, 2)):
+            address = f'Москва, Ленинский проспект, {number + 1}'
+            latitude, longitude = make_coordinates(number)
+            location = Location.objects.create(
+                address=address,
+                latitude=latitude,
+                longitude=longitude,
+                lookup_status='found',
+            )
+            restaurants.append(Restaurant(
+                name=f'Star Burger {number}',
+                address=address,
+                location=location,
+                latitude=latitude,
+                longitude=longitude,
+            ))
+        Restaurant.objects.bulk_create(restaurants)
+        restaurants = list(Restaurant.objects.order_by('pk'))
+        RestaurantMenuItem.objects.bulk_create(
+            RestaurantMenuItem(restaurant=restaurant, product=product)
+            for restaurant in restaurants
+            for product in products
+        )
+
+        addresses = [f'Москва, Тверская улица, {number + 1}' for number in range(scale)]
+        Location.objects.bulk_create(
+            Location(
+                address=address,
+                normalized_address=normalize_address(address),
+                latitude=make_coordinates(number + 7)[0],
+                longitude=make_coordinates(number + 7)[1],
+                lookup_status='found',
+            )
+            for number, address in enumerate(addresses)
+        )
+        GeocodingJob.objects.bulk_create(
+            GeocodingJob(address=f'Москва, Арбат, {number + 1}') for number in range(scale)
+        )
+        Order.objects.bulk_create(
+            Order(
+                firstname='Иван',
+                lastname='Петров',
+                phonenumber='+79161234567',
+                phonenumber_e164='+79161234567',
+                address=address,
+                normalized_address=normalize_address(address),
+                restaurant=restaurants[0] if number % 3 == 0 else None,
+                total_cost=products[number].price * 2,
+            )
+            for number, address in enumerate(addresses)
+        )
+        orders = list(Order.objects.order_by('pk'))
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=products[number], quantity=2, price=products[number].price)
+            for number, order in enumerate(orders)
+        )
+
+        availability_index.invalidate()
+        invalidate_catalog_snapshot()
+        invalidate_restaurant_index()
+        transaction.on_commit(lambda: refresh_order_candidates(get_open_order_ids()))
+
+    def get_order_payload(self):
+        product_ids = Product.objects.order_by('pk').values_list('pk', flat=True)[:3]
+        return {
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79161234567',
+            'address': 'Москва, Тверская улица, 1',
+            'products': [{'product': product_id, 'quantity': 1} for product_id in product_ids],
+        }
+
+    def request(self, method, path, **headers):
+        if method == 'post':
+            return self.client.post(
+                path,
+                self.get_order_payload(),
+                content_type='application/json',
+                **headers,
+            )
+        if method == 'post_batch':
+            return self.client.post(
+                path,
+                [self.get_order_payload()] * 3,
+                content_type='application/json',
+                **headers,
+            )
+        return self.client.get(path, **headers)
+
+    def measure(self, method, get_path, **headers):
+        # Первый прогон прогревает кэши процесса (типы контента, шаблоны)
+        # и в результат не попадает.
+        results = []
+        for scale in [SCALES[0]] + SCALES:
+            with transaction.atomic():
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.seed(scale)
+                path = get_path()
+                self.client.force_login(self.manager)
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.request(method, path, **headers)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                self.assertLess(response.status_code, 400, path)
+                results.append(len(queries))
+                transaction.set_rollback(True)
+        return results[1:]
+
+    def assertWithinBudget(self, method, get_path, max_queries, **headers):
+        query_counts = self.measure(method, get_path, **headers)
+        self.assertEqual(
+            len(set(query_counts)),
+            1,
+            f'Число запросов растёт с данными: {dict(zip(SCALES, query_counts))}',
+        )
+        self.assertLessEqual(query_counts[-1], max_queries)
+
+    def test_views_within_budget(self):
+        for name, (method, path, max_queries) in self.budgets.items():
+            with self.subTest(name):
+                self.assertWithinBudget(method, lambda: path, max_queries)
+
+    @override_settings(CATALOG_SNAPSHOT=False)
+    def test_streamed_catalog_within_budget(self):
+        self.assertWithinBudget('get', lambda: '/api/products/', 2)
+
+    def test_journaled_order_within_budget(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(ORDER_INTAKE_JOURNAL=True, ORDER_JOURNAL_DIR=directory):
+                self.assertWithinBudget('post', lambda: '/api/order/', 4)
+
+    def test_manager_order_stream_within_budget(self):
+        self.assertWithinBudget(
+            'get',
+            lambda: '/manager/orders/events/?timeout=0',
+            4,
+            HTTP_ACCEPT='text/event-stream',
+        )
+
+    def test_admin_pages_within_budget(self):
+        for model in admin.site._registry:
+            opts = model._meta
+            url_prefix = f'admin:{opts.app_label}_{opts.model_name}'
+
+            def get_change_path(model=model, url_prefix=url_prefix):
+                return reverse(f'{url_prefix}_change', args=[model.objects.order_by('pk').first().pk])
+
+            pages = [
+                ('changelist', lambda url_prefix=url_prefix: reverse(f'{url_prefix}_changelist'), self.admin_changelist_budget),
+                ('add', lambda url_prefix=url_prefix: reverse(f'{url_prefix}_add'), self.admin_add_budget),
+                ('change', get_change_path, self.admin_change_budget),
+            ]
+            for page, get_path, max_queries in pages:
+                with self.subTest(f'{opts.label} {page}'):
+                    self.assertWithinBudget('get', get_path, max_queries)
+
+    def test_admin_phone_search_within_budget(self):
+        self.assertWithinBudget(
+            'get',
+            lambda: '/admin/foodcartapp/order/?q=8+(916)+123-45-67',
+            self.admin_changelist_budget,
+        )
+
+    def test_every_url_has_budget(self):
+        budgeted_paths = {path.split('?')[0] for _, path, _ in self.budgets.values()}
+        for path in iter_plain_paths(get_resolver().url_patterns):
+            if any(path.startswith(prefix) for prefix in UNBUDGETED_PREFIXES):
+                continue
+            with self.subTest(path):
+                self.assertIn(f'/{path}', budgeted_paths)
+
+
+def iter_plain_paths(patterns, prefix=''):
+    # Пути без параметров: только их можно открыть без данных из URL.
+    for pattern in patterns:
+        route = str(pattern.pattern)
+        if '<' in route or route.startswith('^'):
+            continue
+        if isinstance(pattern, URLResolver):
+            yield from iter_plain_paths(pattern.url_patterns, prefix + route)
+        elif isinstance(pattern, URLPattern):
+            yield prefix + route
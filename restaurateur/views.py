@@ -1,16 +1,22 @@
-from geopy import distance
+import json
+import time
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
 from django import forms
+from django.conf import settings
+from django.db.models import F, Prefetch, Q
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import redirect, render
 from django.views import View
 from django.urls import reverse_lazy
 from django.contrib.auth.decorators import user_passes_test
 from django.contrib.auth import authenticate, login
 from django.contrib.auth import views as auth_views
-from collections import defaultdict
 
 
-from foodcartapp.models import Product, Restaurant, Order, RestaurantMenuItem
-from geodata.models import Location
+from foodcartapp.models import Product, Restaurant, Order, OrderCandidate
+from foodcartapp.order_feed import get_order_feed
 
 
 class Login(forms.Form):
@@ -30,6 +36,126 @@ class Login(forms.Form):
     )
 
 
+class OrderFilterForm(forms.Form):
+    status = forms.ChoiceField(
+        label='Статус',
+        required=False,
+        choices=[('', 'Все')] + [
+            choice for choice in Order.STATUS_CHOICES if choice[0] != 'completed'
+        ],
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+    payment_method = forms.ChoiceField(
+        label='Оплата',
+        required=False,
+        choices=[('', 'Все')] + Order.PAYMENT_METHODS,
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+    restaurant = forms.ModelChoiceField(
+        label='Ресторан',
+        required=False,
+        queryset=Restaurant.objects.order_by('name'),
+        empty_label='Все',
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+    created_from = forms.DateField(
+        label='С',
+        required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+    )
+    created_to = forms.DateField(
+        label='По',
+        required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+    )
+
+    def filter(self, orders):
+        if not self.is_valid():
+            return orders
+        filters = self.cleaned_data
+        if filters['status']:
+            orders = orders.filter(status=filters['status'])
+        if filters['payment_method']:
+            orders = orders.filter(payment_method=filters['payment_method'])
+        if filters['restaurant']:
+            orders = orders.filter(restaurant=filters['restaurant'])
+        if filters['created_from']:
+            orders = orders.filter(created_at__date__gte=filters['created_from'])
+        if filters['created_to']:
+            orders = orders.filter(created_at__date__lte=filters['created_to'])
+        return orders
+
+
+def encode_order_cursor(order):
+    position = [order.status, order.created_at.isoformat(), order.id]
+    return urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_order_cursor(cursor):
+    try:
+        status, created_at, order_id = json.loads(urlsafe_b64decode(cursor.encode()))
+        return status, datetime.fromisoformat(created_at), int(order_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def paginate_orders(orders, cursor, page_size):
+    orders = orders.order_by('status', 'created_at', 'id')
+    position = decode_order_cursor(cursor) if cursor else None
+    if position:
+        status, created_at, order_id = position
+        orders = orders.filter(
+            Q(status__gt=status)
+            | Q(status=status, created_at__gt=created_at)
+            | Q(status=status, created_at=created_at, id__gt=order_id)
+        )
+    page = list(orders[:page_size + 1])
+    next_cursor = encode_order_cursor(page[page_size - 1]) if len(page) > page_size else None
+    return page[:page_size], next_cursor
+
+
+def get_page_query(request, cursor):
+    query = request.GET.copy()
+    query.pop('after', None)
+    if cursor:
+        query['after'] = cursor
+    return query.urlencode()
+
+
+def parse_event_id(value):
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_timeout(value, max_timeout):
+    try:
+        return min(max(float(value), 0), max_timeout)
+    except (TypeError, ValueError):
+        return max_timeout
+
+
+def format_server_sent_event(event):
+    data = json.dumps(event, ensure_ascii=False)
+    return f"id: {event['id']}\nevent: {event['kind']}\ndata: {data}\n\n"
+
+
+def stream_order_events(feed, after, duration):
+    yield 'retry: 1000\n\n'
+    deadline = time.monotonic() + duration
+    while True:
+        remaining = max(deadline - time.monotonic(), 0)
+        events = feed.wait(after, min(settings.ORDER_FEED_WAIT_TIMEOUT, remaining))
+        for event in events:
+            after = event['id']
+            yield format_server_sent_event(event)
+        if not events:
+            yield ': keepalive\n\n'
+        if not remaining:
+            return
+
+
 class LoginView(View):
     def get(self, request, *args, **kwargs):
         form = Login()
@@ -68,7 +194,7 @@ def is_manager(user):
 @user_passes_test(is_manager, login_url='restaurateur:login')
 def view_products(request):
     restaurants = list(Restaurant.objects.order_by('name'))
-    products = list(Product.objects.prefetch_related('menu_items'))
+    products = list(Product.objects.select_related('category').prefetch_related('menu_items'))
 
     products_with_restaurant_availability = []
     for product in products:
@@ -94,85 +220,66 @@ def view_restaurants(request):
 
 @user_passes_test(is_manager, login_url='restaurateur:login')
 def view_orders(request):
-    orders = Order.objects.exclude(
-        status='completed').prefetch_related(
-            'items__product').order_by('status').total_cost()
-
-    restaurants = Restaurant.objects.all()
-
-    restaurant_addresses = [restaurant.address.strip() for restaurant in restaurants]
-    order_addresses = [order.address.strip() for order in orders]
-    all_addresses = list(set(restaurant_addresses + order_addresses))
-
-    locations = Location.objects.filter(address__in=all_addresses)
-
-    location_by_address = {
-        location.address.strip(): (float(location.latitude), float(location.longitude))
-        for location in locations if location.latitude and location.longitude
-    }
-
-    restaurant_coords = {}
-    for restaurant in restaurants:
-        coords = location_by_address.get(restaurant.address.strip())
-        if coords:
-            restaurant_coords[restaurant.id] = coords
-
-    menu_items = RestaurantMenuItem.objects.filter(availability=True).values('product_id', 'restaurant_id')
-
-    product_to_restaurants = defaultdict(list)
-    for item in menu_items:
-        product_to_restaurants[item['product_id']].append(item['restaurant_id'])
-
-    restaurants = Restaurant.objects.in_bulk()
+    last_event_id = get_order_feed().last_id()
+    filter_form = OrderFilterForm(request.GET)
+    candidates = OrderCandidate.objects.select_related('restaurant').order_by(
+        F('distance').asc(nulls_last=True),
+        'restaurant__name',
+    )
+    orders = filter_form.filter(
+        Order.objects.exclude(status='completed')
+    ).select_related('restaurant').prefetch_related(
+        Prefetch('candidates', queryset=candidates),
+    )
 
+    orders, next_cursor = paginate_orders(
+        orders,
+        request.GET.get('after'),
+        settings.MANAGER_ORDERS_PAGE_SIZE,
+    )
     for order in orders:
-        product_ids = [item.product.id for item in order.items.all()]
-
-        if not product_ids:
-            order.available_restaurants = []
-            continue
-
-        common_restaurants = None
-        for product_id in product_ids:
-            if product_id not in product_to_restaurants:
-                common_restaurants = []
-                break
-
-            if common_restaurants is None:
-                common_restaurants = set(product_to_restaurants[product_id])
-            else:
-                common_restaurants.intersection_update(
-                    product_to_restaurants[product_id]
-                )
-
-        if common_restaurants:
-            order.available_restaurants = [
-                restaurants[restaurant_id]
-                for restaurant_id in common_restaurants
-            ]
-
-            order_coord = location_by_address.get(order.address.strip())
-            if order_coord:
-                distances = []
-                for restaurant in order.available_restaurants:
-                    restaurant_coord = restaurant_coords.get(restaurant.id)
-                    if restaurant_coord:
-                        dist = round(distance.distance(order_coord, restaurant_coord).km, 2)
-                        distances.append((restaurant, dist))
-                    else:
-                        distances.append((restaurant, None))
-                order.distances = sorted(
-                    distances,
-                    key=lambda x: (x[1] is None, x[1])
-                )
-            else:
-                order.distances = [(restaurant, None) for restaurant in order.available_restaurants]
-        else:
-            order.available_restaurants = []
-            order.distances = []
+        order.distances = [
+            (candidate.restaurant, candidate.distance)
+            for candidate in order.candidates.all()
+        ]
 
     return render(
         request,
         template_name='order_items.html',
-        context={'order_items': orders}
+        context={
+            'order_items': orders,
+            'filter_form': filter_form,
+            'next_page_query': get_page_query(request, next_cursor) if next_cursor else None,
+            'is_first_page': 'after' not in request.GET,
+            'first_page_query': get_page_query(request, None),
+            'last_event_id': last_event_id,
+        }
     )
+
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def view_order_events(request):
+    feed = get_order_feed()
+    after = parse_event_id(request.headers.get('Last-Event-ID'))
+    if after is None:
+        after = parse_event_id(request.GET.get('after'))
+    if after is None:
+        after = feed.last_id()
+
+    if 'text/event-stream' in request.headers.get('Accept', ''):
+        duration = parse_timeout(request.GET.get('timeout'), settings.ORDER_FEED_STREAM_TIMEOUT)
+        response = StreamingHttpResponse(
+            stream_order_events(feed, after, duration),
+            content_type='text/event-stream',
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    timeout = parse_timeout(request.GET.get('timeout'), settings.ORDER_FEED_WAIT_TIMEOUT)
+    events = feed.wait(after, timeout)
+    return JsonResponse({
+        'events': events,
+        'last_id': events[-1]['id'] if events else after,
+    }, json_dumps_params={'ensure_ascii': False})
+
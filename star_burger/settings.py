@@ -15,9 +15,43 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 SECRET_KEY = env('SECRET_KEY')
 DEBUG = env.bool('DEBUG', True)
 YANDEX_APIKEY = env('YANDEX_APIKEY')
+GEOCODER = env('GEOCODER', 'geodata.geocoders.YandexGeocoder')
+GEOCODER_FALLBACK = env('GEOCODER_FALLBACK', None)
+GAZETTEER_PATH = env('GAZETTEER_PATH', os.path.join(BASE_DIR, 'gazetteer.csv'))
+YANDEX_GEOCODER_URL = env('YANDEX_GEOCODER_URL', 'https://geocode-maps.yandex.ru/1.x')
+GEOCODER_CONNECT_TIMEOUT = env.float('GEOCODER_CONNECT_TIMEOUT', 3.05)
+GEOCODER_READ_TIMEOUT = env.float('GEOCODER_READ_TIMEOUT', 5)
+GEOCODER_MAX_RETRIES = env.int('GEOCODER_MAX_RETRIES', 2)
+GEOCODER_RETRY_BACKOFF = env.float('GEOCODER_RETRY_BACKOFF', 0.5)
+GEOCODER_FAILURE_THRESHOLD = env.int('GEOCODER_FAILURE_THRESHOLD', 5)
+GEOCODER_RECOVERY_TIMEOUT = env.float('GEOCODER_RECOVERY_TIMEOUT', 30)
+GEOCODE_REFRESH_TTL = env.int('GEOCODE_REFRESH_TTL', 90 * 24 * 60 * 60)
+GEOCODE_NEGATIVE_TTL = env.int('GEOCODE_NEGATIVE_TTL', 60 * 60)
+GEOCODE_NEGATIVE_TTL_MAX = env.int('GEOCODE_NEGATIVE_TTL_MAX', 30 * 24 * 60 * 60)
+GEOCODE_LOOKUP_LEASE = env.int('GEOCODE_LOOKUP_LEASE', 60)
+GEOCODE_LOOKUP_WAIT = env.float('GEOCODE_LOOKUP_WAIT', 15)
 
 ALLOWED_HOSTS = env.list('ALLOWED_HOSTS', ['127.0.0.1', 'localhost'])
 
+COMPACT_JSON = env.bool('COMPACT_JSON', not DEBUG)
+CATALOG_SNAPSHOT = env.bool('CATALOG_SNAPSHOT', True)
+CATALOG_CHUNK_SIZE = env.int('CATALOG_CHUNK_SIZE', 500)
+NEAREST_RESTAURANTS_LIMIT = env.int('NEAREST_RESTAURANTS_LIMIT', 5)
+DELIVERY_RADIUS_KM = env.float('DELIVERY_RADIUS_KM', None)
+DISTANCE_CACHE_SIZE = env.int('DISTANCE_CACHE_SIZE', 100000)
+MANAGER_ORDERS_PAGE_SIZE = env.int('MANAGER_ORDERS_PAGE_SIZE', 50)
+IDEMPOTENCY_KEY_TTL = env.int('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+ORDER_BATCH_MAX_SIZE = env.int('ORDER_BATCH_MAX_SIZE', 500)
+ORDER_INTAKE_JOURNAL = env.bool('ORDER_INTAKE_JOURNAL', False)
+ORDER_JOURNAL_DIR = env('ORDER_JOURNAL_DIR', os.path.join(BASE_DIR, 'journal'))
+ORDER_JOURNAL_GROUP_COMMIT_DELAY = env.float('ORDER_JOURNAL_GROUP_COMMIT_DELAY', 0.002)
+ORDER_JOURNAL_DRAIN_BATCH = env.int('ORDER_JOURNAL_DRAIN_BATCH', 500)
+ORDER_FEED = env('ORDER_FEED', 'foodcartapp.order_feed.DatabaseOrderFeed')
+ORDER_FEED_POLL_INTERVAL = env.float('ORDER_FEED_POLL_INTERVAL', 1)
+ORDER_FEED_WAIT_TIMEOUT = env.float('ORDER_FEED_WAIT_TIMEOUT', 25)
+ORDER_FEED_STREAM_TIMEOUT = env.float('ORDER_FEED_STREAM_TIMEOUT', 300)
+ORDER_FEED_RETENTION = env.int('ORDER_FEED_RETENTION', 24 * 60 * 60)
+
 INSTALLED_APPS = [
     'foodcartapp.apps.FoodcartappConfig',
     'restaurateur.apps.RestaurateurConfig',
@@ -89,6 +123,10 @@ DATABASES = {
     )
 }
 
+CACHES = {
+    'default': env.dj_cache_url('CACHE_URL', 'locmem://'),
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',